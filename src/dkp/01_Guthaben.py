@@ -15,11 +15,13 @@ def main():
         layout="wide",
         initial_sidebar_state="expanded")
 
+    app.refresh_data()
     season = build_season_selector()
     balance = app.get_balance(season)
     build_sidebar(season)
     build_notification_area(balance)
     build_balance(season, balance)
+    build_balance_history(season)
     build_loot_history(season)
 
 
@@ -67,6 +69,11 @@ def build_notification_area(balance: list[Balance]):
 def build_balance(season: Season, balance_list: list[Balance]):
     st.markdown("### DKP Liste")
     show_all = st.checkbox("alle anzeigen", value=False)
+    dates = app.get_balance_dates(season)
+    if len(dates) > 1:
+        as_of = st.select_slider("Stand nach Raid vom:", options=dates, value=dates[-1])
+        if as_of != dates[-1]:
+            balance_list = app.get_balance_as_of(season, as_of)
     balance_list = balance_list if show_all else app.filter_by_active_player(balance_list, season)
     st.dataframe(
         pd.DataFrame([balance.model_dump() for balance in balance_list], columns=["name", "value", "income", "cost", "characters"]).sort_values(
@@ -83,6 +90,18 @@ def build_balance(season: Season, balance_list: list[Balance]):
     )
 
 
+def build_balance_history(season: Season):
+    st.markdown("### Verlauf")
+    player_names = sorted(balance.name for balance in app.filter_by_active_player(app.get_balance(season), season))
+    if not player_names:
+        return
+    player_name = st.selectbox("Spieler:", player_names)
+    history = app.get_balance_history(season, player_name)
+    st.line_chart(
+        pd.DataFrame({"Guthaben": [balance.value for balance in history.values()]}, index=pd.to_datetime(list(history.keys()))),
+    )
+
+
 def build_loot_history(season: Season):
     st.markdown("### Loot Liste")
     st.dataframe(
@@ -4,26 +4,34 @@ Business logic for the DKP webapp.
 
 # pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
 
+import asyncio
 import logging
 import os
 
 import toml
+from balance_frame import compute_balance_list
 from config_mapper import Config
 from core import (
+    BID_RESPONSE,
     Balance,
+    CommitStatus,
     Fix,
     FixEntry,
+    LootImport,
     RaidChecklist,
+    RaidStats,
     Season,
     get_evn_var,
     is_local_development,
     list_to_csv,
-    to_date,
     today,
 )
 from dotenv import load_dotenv
 from github_client import GithubClient, Loot, Player, Raid, RawLoot, csv_to_list
-from warcraftlogs_client import WclClient
+from ledger import BalanceLedger
+from loot_import import check_character, check_loot_export, check_note
+from storage import LocalStorage
+from warcraftlogs_client import AsyncWclClient, WclClient
 
 load_dotenv()
 log = logging.getLogger(__name__)
@@ -33,18 +41,41 @@ PROJECT_VERSION = PROJECT_DATA["project"]["version"]
 
 WCL_CLIENT_ID = get_evn_var("WCL_CLIENT_ID")
 WCL_CLIENT_SECRET = get_evn_var("WCL_CLIENT_SECRET")
-GITHUB_TOKEN = get_evn_var("GITHUB_CLIENT_TOKEN")
 ADMIN_PASSWORD = get_evn_var("ADMIN_PASSWORD")
-BRANCH_NAME = get_evn_var("BRANCH_NAME")
+LOCAL_STORAGE_DIR = os.environ.get("LOCAL_STORAGE_DIR")  # optional, e.g. "." to work on the local data files
 
 CONFIG = Config()
 
-WCL_CLIENT = WclClient(CONFIG.auth.wcl_client, WCL_CLIENT_ID, WCL_CLIENT_SECRET)
-DATABASE = GithubClient(BRANCH_NAME, GITHUB_TOKEN)
+WCL_CLIENT = WclClient(CONFIG.auth.wcl_client, WCL_CLIENT_ID, WCL_CLIENT_SECRET, cache_dir=CONFIG.cache.wcl_client)
+WCL_ASYNC_CLIENT = AsyncWclClient(WCL_CLIENT)
+if LOCAL_STORAGE_DIR:
+    DATABASE = GithubClient(
+        storage=LocalStorage(LOCAL_STORAGE_DIR),
+        write_behind=True,
+        max_loot_seasons=CONFIG.cache.loot_seasons,
+        sqlite_path=CONFIG.cache.sqlite,
+    )
+else:
+    DATABASE = GithubClient(
+        get_evn_var("BRANCH_NAME"),
+        get_evn_var("GITHUB_CLIENT_TOKEN"),
+        bulk_sync=True,
+        cache_dir=CONFIG.cache.github_client,
+        write_behind=True,
+        max_loot_seasons=CONFIG.cache.loot_seasons,
+        sqlite_path=CONFIG.cache.sqlite,
+    )
 
 
 INITIAL_BALANCE = 100
 ATTENDANCE_BONUS = 50
+REFRESH_INTERVAL = 60  # seconds between checks for changes committed by other app instances
+
+LEDGER = BalanceLedger(DATABASE, INITIAL_BALANCE, ATTENDANCE_BONUS)
+
+
+def refresh_data(force: bool = False) -> list[str]:
+    return DATABASE.refresh(max_age=0 if force else REFRESH_INTERVAL)
 
 
 def get_admin_password():
@@ -105,66 +136,93 @@ def filter_by_active_player(balance_list: list[Balance], season: Season) -> list
 
 def get_balance(season: Season) -> list[Balance]:
     log.debug("get_balance")
-    loot = get_loot_history(season)
-    player_to_cost_pair = get_player_to_cost_pair(DATABASE.player_list, loot)
-    balance_list = init_balance_list(DATABASE.player_list)
-    balance_list = add_income_to_balance_list(balance_list, DATABASE.get_raid_list(season))
+    if DATABASE.is_archived(season):
+        return [balance.model_copy() for balance in DATABASE.get_archive(season).balance]
+    return LEDGER.get_balance(season)
+
+
+def get_balance_as_of(season: Season, date: str) -> list[Balance]:
+    """Balance after all raids of the season up to and including the date."""
+    return LEDGER.get_balance(season, as_of=date)
+
+
+def get_balance_history(season: Season, player_name: str) -> dict[str, Balance]:
+    return LEDGER.get_balance_history(season, DATABASE.find_player_by_name(player_name))
+
+
+def get_balance_dates(season: Season) -> list[str]:
+    return LEDGER.get_dates(season)
+
+
+def verify_balance(season: Season) -> bool:
+    """Compares the ledger with a balance calculated from scratch and rebuilds it on mismatch."""
+    raid_list = DATABASE.get_raid_list(season)
+    expected = compute_balance_list(DATABASE.player_list, raid_list, get_loot_history(season), INITIAL_BALANCE, ATTENDANCE_BONUS)
+    if get_balance(season) == expected:
+        return True
+    log.warning(f"Balance ledger out of sync for season {season.name}, rebuilding it")
+    LEDGER.rebuild(season)
+    return False
+
+
+def compute_balance(player_list: list[Player], raid_list: list[Raid], loot_table: list[Loot]) -> list[Balance]:
+    """Reference calculation player by player, compute_balance_list and the ledger have to match it."""
+    log.debug("compute_balance")
+    player_to_cost_pair = get_player_to_cost_pair(player_list, loot_table)
+    balance_list = init_balance_list(player_list)
+    balance_list = add_income_to_balance_list(balance_list, raid_list)
     balance_list = add_cost_to_balance_list(balance_list, player_to_cost_pair)
     return balance_list
 
 
 def validate_characters_known(known_player: list[Player], looting_characters: list[str]):
-    known_characters = []
+    known_characters = set()
     for player in known_player:
-        known_characters.extend(player.chars)
+        known_characters.update(player.chars)
 
     for char in looting_characters:
-        if char not in known_characters:
-            raise ValueError("Unknown character: " + char)
+        message = check_character(char, known_characters)
+        if message:
+            raise ValueError(message)
 
 
 def validate_note_values(cost_list: list[str]):
     for note in cost_list:
-        if note.strip() == "":
-            continue
-        try:
-            int(note)
-        except ValueError as e:
-            raise ValueError("Note must be a parsable integer, but was: " + note) from e
-        if int(note) < 10:
-            raise ValueError("Note minimum is 10, but was: " + note)
-        if int(note) % 10 != 0:
-            raise ValueError("Note must be within steps of 10, but was: " + note)
-
-
-def validate_expected_state(raw_loot_list: list[RawLoot]):
-    # validate list is not empty
-    if not raw_loot_list:
-        raise ValueError("Empty list. Updated same list before?")
-
-    # validate each entry has a unique id
-    unique_ids = set()
-    for entry in raw_loot_list:
-        if entry.id in unique_ids:
-            raise ValueError(f'Duplicate id found! (id="{entry.id}").')
-        unique_ids.add(entry.id)
-
-    # validate each date is the same
-    first_date = raw_loot_list[0].date
-    for entry in raw_loot_list:
-        if entry.date != first_date:
-            raise ValueError("Dates differ from each other.")
-
-    # each entry having response == "Gebot" must have a non empty note
-    for entry in raw_loot_list:
-        if entry.response == "Gebot" and entry.note.strip() == "":
-            raise ValueError(f'Respone is "Gebot" but empty note! (id="{entry.id}").')
-
-
-def validate_import(raw_loot_list: list[RawLoot]):
-    validate_expected_state(raw_loot_list)
-    validate_characters_known(DATABASE.player_list, [entry.player for entry in raw_loot_list])
-    validate_note_values([entry.note for entry in raw_loot_list])
+        message = check_note(note)
+        if message:
+            raise ValueError(message)
+
+
+def check_loot_import(content: str) -> LootImport:
+    known_characters = {char for player in DATABASE.player_list for char in player.chars}
+    return check_loot_export(content, _get_existing_loot_ids, known_characters, _get_locked_reason)
+
+
+def _get_existing_loot_ids(raid_day: str) -> set[str]:
+    season = DATABASE.find_season_by_raid(DATABASE.find_raid_by_date(raid_day))
+    if DATABASE.is_archived(season):
+        return {loot.id for loot in DATABASE.get_archive(season).loot.get(raid_day, [])}
+    return {loot.id for loot in DATABASE.get_raid_loot_raw(raid_day)}
+
+
+def _get_locked_reason(raid_day: str) -> str | None:
+    season = DATABASE.find_season_by_raid(DATABASE.find_raid_by_date(raid_day))
+    if DATABASE.is_archived(season):
+        return f"Season {season.name} is archived, loot logs can't be changed anymore."
+    return None
+
+
+def import_loot(loot_import: LootImport):
+    if loot_import.issues:
+        raise ValueError(f"Import has {len(loot_import.issues)} issues.")
+    # the loot logs of all raid days are committed together
+    with DATABASE.batch_commit(f"Import loot: {list_to_csv(list(loot_import.new_loot))}"):
+        for raid_day, new_loot in loot_import.new_loot.items():
+            existing_log = DATABASE.get_raid_loot_raw(raid_day)
+            if existing_log:
+                DATABASE.update_loot_log(merging_logs(list(existing_log), new_loot), raid_day)
+            else:
+                DATABASE.create_loot_log(new_loot, raid_day)
 
 
 def get_info_last_update(season: Season) -> tuple[str, str, str]:
@@ -177,74 +235,84 @@ def get_info_last_update(season: Season) -> tuple[str, str, str]:
 
 def get_loot_history(season: Season) -> list[Loot]:
     season_loot = DATABASE.get_season_loot(season)
-    return [entry for entry in season_loot if entry.response == "Gebot"]
+    return [entry for entry in season_loot if entry.response == BID_RESPONSE]
 
 
 def get_attending_player_list(report_id):
-    char_list = WCL_CLIENT.get_attending_character_list(report_id)
-    # find attending players
-    player_list = []
-    for player in DATABASE.player_list:
-        for char in char_list:
-            if char in player.chars:
-                player_list.append(player.name)
-                break
-    return player_list
-
+    return get_attending_player_lists([report_id])[report_id]
 
-def upload_loot_log(raw_loot_list: list[RawLoot]):
-    raid_day = to_date(raw_loot_list[0].date)
-    existing_log = DATABASE.get_raid_loot_raw(raid_day)
-
-    if existing_log:
-        result = merging_logs(existing_log, raw_loot_list)
-        DATABASE.update_loot_log(result, raid_day)
-    else:
-        DATABASE.create_loot_log(raw_loot_list, raid_day)
 
-
-def filter_logs(existing_log: list[RawLoot], new_log: list[RawLoot]) -> list[RawLoot]:
-    existing_ids = {loot.id for loot in existing_log}
-    return [item for item in new_log if item.id not in existing_ids]
+def get_attending_player_lists(report_ids: list[str], background: bool = False) -> dict[str, list[str]]:
+    result = {}
+    for report_id, char_list in WCL_CLIENT.get_attending_character_lists(report_ids, background).items():
+        # find attending players
+        attending_player_ids = set()
+        for char in char_list:
+            try:
+                attending_player_ids.add(DATABASE.find_player_by_character(char).id)
+            except ValueError:
+                pass  # unknown character, e.g. a guest
+        result[report_id] = [player.name for player in DATABASE.player_list if player.id in attending_player_ids]
+    return result
 
 
 def merging_logs(existing_log: list[RawLoot], new_log: list[RawLoot]) -> list[RawLoot]:
     result = existing_log
-    existing_ids = [loot.id for loot in existing_log]
+    existing_ids = {loot.id for loot in existing_log}
     for item in new_log:
         if item.id not in existing_ids:
             result.append(item)
     return result
 
 
-def apply_fix_to_loot_log(fixes: list[Fix], raid_day: str, reason: str):
-    existing_log = DATABASE.get_raid_loot_raw(raid_day)
-    if not existing_log:
-        raise ValueError(f"No loot log found! raid day: {raid_day}")
-    result = apply_fixes(existing_log, fixes)
-    DATABASE.fix_loot_log(result, raid_day, reason)
+def apply_fixes_to_loot_logs(fixes: list[Fix], season: Season, reason: str):
+    """Applies fixes to the loot of any raid of the season, all changed loot logs are committed together."""
+    if DATABASE.is_archived(season):
+        raise ValueError(f"Season {season.name} is archived, loot logs can't be changed anymore.")
+    season_loot = DATABASE.get_season_loot_raw_by_raid(season)
+    raid_by_loot_id = {loot.id: raid for raid, loot_list in season_loot.items() for loot in loot_list}
+    unknown_ids = [fix.id for fix in fixes if fix.id not in raid_by_loot_id]
+    if unknown_ids:
+        raise ValueError(f"No loot found in {season.name} for ids: {list_to_csv(unknown_ids)}")
+    fixes_by_raid: dict[Raid, list[Fix]] = {}
+    for fix in fixes:
+        fixes_by_raid.setdefault(raid_by_loot_id[fix.id], []).append(fix)
+
+    # fixed on copies, the stored loot stays untouched if the result is invalid
+    result = {
+        raid: apply_fixes([loot.model_copy() for loot in season_loot[raid]], raid_fixes) for raid, raid_fixes in fixes_by_raid.items()
+    }
+    fixed_ids = {fix.id for fix in fixes}
+    fixed_loot = [loot for loot_list in result.values() for loot in loot_list if loot.id in fixed_ids]
+    validate_characters_known(DATABASE.player_list, [loot.player for loot in fixed_loot])
+    validate_note_values([loot.note for loot in fixed_loot])
+
+    with DATABASE.batch_commit(f"Fix: {reason}"):
+        for raid in sorted(result, key=lambda raid: raid.date):
+            DATABASE.fix_loot_log(result[raid], raid.date, reason)
 
 
 def apply_fixes(existing_log: list[RawLoot], fixes: list[Fix]) -> list[RawLoot]:
-    result = existing_log
+    loot_by_id = {loot.id: loot for loot in existing_log}
     for fix in fixes:
-        for loot in existing_log:
-            if loot.id == fix.id:
-                for e in fix.entries:
-                    if e.name == "character":
-                        # hack:
-                        #   due to naming clash between player and character
-                        #   clean up function shifted raw field 'player' to clean field 'character'
-                        #   need to revert here
-                        loot.player = e.value
-                    elif e.name == "note":
-                        loot.note = e.value
-                    elif e.name == "response":
-                        loot.response = e.value
-                    else:
-                        # sanity check
-                        raise KeyError(f"Invalid key: {e.name}")
-    return result
+        loot = loot_by_id.get(fix.id)
+        if loot is None:
+            continue
+        for e in fix.entries:
+            if e.name == "character":
+                # hack:
+                #   due to naming clash between player and character
+                #   clean up function shifted raw field 'player' to clean field 'character'
+                #   need to revert here
+                loot.player = e.value
+            elif e.name == "note":
+                loot.note = e.value
+            elif e.name == "response":
+                loot.response = e.value
+            else:
+                # sanity check
+                raise KeyError(f"Invalid key: {e.name}")
+    return existing_log
 
 
 def get_current_season() -> Season:
@@ -275,6 +343,10 @@ def find_raid_by_date(date: str) -> Raid:
     return DATABASE.find_raid_by_date(date)
 
 
+def get_season_loot(season: Season) -> list[Loot]:
+    return DATABASE.get_season_loot(season)
+
+
 def get_raid_loot(raid_day: str) -> list[Loot]:
     return DATABASE.get_raid_loot(raid_day)
 
@@ -364,9 +436,11 @@ def update_raid(fixes: list[Fix]):
 
 
 def _update_raid(fixes: list[Fix]):
-    DATABASE.update_raid(fixes)
-    balance_list = {balance.name: str(balance.value) for balance in get_balance(get_current_season())}
-    DATABASE.create_raid_excel_file(balance_list)
+    # raid and balance fallback file are committed together, so they never disagree
+    with DATABASE.batch_commit("Update"):
+        DATABASE.update_raid(fixes)
+        balance_list = {balance.name: str(balance.value) for balance in get_balance(get_current_season())}
+        DATABASE.create_raid_excel_file(balance_list)
 
 
 def delete_raid(raid_date: str):
@@ -381,10 +455,34 @@ def delete_season(season_desc: str):
     DATABASE.delete_season(season_desc)
 
 
+def get_closed_season_list() -> list[Season]:
+    """Seasons followed by a newer one and not archived yet."""
+    return [
+        season
+        for season in DATABASE.season_list
+        if not DATABASE.is_archived(season) and any(other.start_date > season.start_date for other in DATABASE.season_list)
+    ]
+
+
+def archive_season(season_desc: str):
+    season = next((s for s in DATABASE.season_list if s.desc == season_desc))
+    if not verify_balance(season):
+        raise ValueError(f"Balance of season {season.name} was out of sync, please check it before archiving.")
+    DATABASE.archive_season(season, LEDGER.get_balance(season))
+
+
 def update_season(fixes: list[Fix]):
     DATABASE.update_season(fixes)
 
 
+def get_commit_status() -> CommitStatus:
+    return DATABASE.get_commit_status()
+
+
+def retry_commits() -> list[str]:
+    return DATABASE.retry_commits()
+
+
 def get_raid_checklist() -> RaidChecklist:
     return DATABASE.raid_checklist
 
@@ -404,9 +502,21 @@ def is_raid_stopped() -> bool:
     return not bool(raid) or bool(raid.player)
 
 
+def fill_missing_attendees() -> list[str]:
+    """Sets the attendees of past raids without attendees from their reports, returns the dates of the updated raids."""
+    raid_list = [raid for raid in _get_open_raid_list() if raid != get_current_raid() and not raid.player and raid.report_id]
+    if not raid_list:
+        return []
+    # backfill, leaves the rate limit for stopping the raid
+    player_lists = get_attending_player_lists([raid.report_id for raid in raid_list], background=True)
+    fixes = [Fix(id=str(raid.id), entries=[FixEntry(name="player", value=list_to_csv(player_lists[raid.report_id]))]) for raid in raid_list]
+    _update_raid(fixes)
+    return [raid.date for raid in raid_list]
+
+
 def find_past_raids_without_attendees() -> list[str]:
     result = []
-    for raid in DATABASE.raid_list:
+    for raid in _get_open_raid_list():
         if raid == get_current_raid():
             continue
         if not raid.player:
@@ -414,6 +524,12 @@ def find_past_raids_without_attendees() -> list[str]:
     return result
 
 
+def _get_open_raid_list() -> list[Raid]:
+    # raids of archived seasons can't be changed anymore
+    archived = {raid.date for season in DATABASE.season_list if DATABASE.is_archived(season) for raid in DATABASE.get_raid_list(season)}
+    return [raid for raid in DATABASE.raid_list if raid.date not in archived]
+
+
 def find_player_with_negative_balance(balance_list: list[Balance]) -> list[str]:
     return [balance.name for balance in balance_list if balance.value < 0]
 
@@ -436,3 +552,9 @@ def get_example_player_details(code: str):
 
 def get_example_report_debug(code: str):
     return WCL_CLIENT.get_example_for_debugging_report(code)
+
+
+def get_season_raid_stats(season: Season) -> list[RaidStats]:
+    # all reports at once, a backfill leaving the rate limit for stopping the raid
+    report_ids = [raid.report_id for raid in DATABASE.get_raid_list(season) if raid.report_id]
+    return asyncio.run(WCL_ASYNC_CLIENT.get_raid_stats_list(report_ids, background=True))
@@ -0,0 +1,37 @@
+"""
+Columnar balance calculation, gives the same result as the loop based functions of the app.
+"""
+
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+
+import pandas as pd
+from core import Balance, Loot, Player, Raid
+
+
+def compute_balance_list(
+    player_list: list[Player], raid_list: list[Raid], loot_table: list[Loot], initial_balance: int, attendance_bonus: int
+) -> list[Balance]:
+    """Calculates the balance of each player, from the attended raids and the loot bought (loot history)."""
+    players = pd.DataFrame({"name": [player.name for player in player_list]})
+
+    # attendance, counted by player name as listed in the raids
+    attendees = pd.Series([name for raid in raid_list for name in raid.player], dtype="object")
+    attendance = players["name"].map(attendees.value_counts()).fillna(0).astype("int64")
+
+    # cost, loot of each character of the player (player position -> character)
+    characters = pd.DataFrame(
+        [(position, char) for position, player in enumerate(player_list) for char in player.chars],
+        columns=["position", "character"],
+    ).drop_duplicates()
+    loot = pd.DataFrame(
+        {"character": [entry.character for entry in loot_table], "cost": [int(entry.note) for entry in loot_table]},
+    )
+    cost_per_character = loot.groupby("character")["cost"].sum()
+    characters["cost"] = characters["character"].map(cost_per_character).fillna(0)
+    cost = characters.groupby("position")["cost"].sum().reindex(players.index, fill_value=0).astype("int64")
+
+    income = initial_balance + attendance_bonus * attendance
+    return [
+        Balance(name=player.name, value=int(i - c), income=int(i), cost=-int(c), characters=player.chars)
+        for player, i, c in zip(player_list, income.tolist(), cost.tolist())
+    ]
@@ -0,0 +1,114 @@
+"""
+Background worker committing file changes, so callers don't wait for the storage.
+"""
+
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+
+import atexit
+import logging
+import time
+from threading import Condition, Thread
+from typing import Callable
+
+from core import CommitStatus, now
+
+log = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = 30  # seconds to wait for pending commits when the process exits
+
+
+class CommitQueue:
+    """Queues file changes and commits them in a background thread.
+
+    Changes to the same file are coalesced, only the latest content is committed. All changes pending at the
+    time the worker picks them up are committed together. A failed commit stays pending and is tried again
+    with the next submitted change or on retry().
+    """
+
+    def __init__(self, commit_func: Callable[[dict[str, str], str], None]):
+        self._commit_func = commit_func
+        self._condition = Condition()
+        self._pending_files: dict[str, str] = {}
+        self._pending_messages: list[str] = []
+        self._in_progress: list[str] = []
+        self._paused = False  # after a failure until the next submit or retry
+        self._status = CommitStatus()
+        self._worker = Thread(target=self._run, name="commit-queue", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush, SHUTDOWN_TIMEOUT)
+
+    def submit(self, files: dict[str, str], commit_msg: str):
+        with self._condition:
+            self._pending_files.update(files)
+            if commit_msg not in self._pending_messages:
+                self._pending_messages.append(commit_msg)
+            self._paused = False
+            self._status = self._status.model_copy(update={"discarded_files": []})
+            self._condition.notify_all()
+
+    def retry(self):
+        with self._condition:
+            self._paused = False
+            self._condition.notify_all()
+
+    def discard(self, file_list: list[str]) -> list[str]:
+        """Drops the pending changes of the files, returns the files actually dropped."""
+        with self._condition:
+            result = sorted(file_path for file_path in file_list if file_path in self._pending_files)
+            for file_path in result:
+                del self._pending_files[file_path]
+            update = {"discarded_files": sorted(set(self._status.discarded_files) | set(result))}
+            if not self._pending_files:
+                self._pending_messages = []
+                if not self._in_progress:
+                    update["last_error"] = ""  # nothing left to retry
+            self._status = self._status.model_copy(update=update)
+            self._condition.notify_all()
+            return result
+
+    def has_pending(self) -> bool:
+        with self._condition:
+            return bool(self._pending_files or self._in_progress)
+
+    def status(self) -> CommitStatus:
+        with self._condition:
+            return self._status.model_copy(update={"pending_files": sorted(set(self._pending_files) | set(self._in_progress))})
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until all pending changes are committed or failed, returns whether nothing is pending anymore."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while (self._pending_files and not self._paused) or self._in_progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return not self._pending_files and not self._in_progress
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending_files or self._paused:
+                    self._condition.wait()
+                files, self._pending_files = self._pending_files, {}
+                messages, self._pending_messages = self._pending_messages, []
+                self._in_progress = list(files)
+            commit_msg = "; ".join(messages)
+            try:
+                self._commit_func(files, commit_msg)
+                error = ""
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log.exception(f"Commit failed: {commit_msg}")
+                error = str(e)
+            with self._condition:
+                self._in_progress = []
+                if error:
+                    # newer changes of the same files win
+                    self._pending_files = files | self._pending_files
+                    self._pending_messages = messages + [m for m in self._pending_messages if m not in messages]
+                    self._paused = True
+                    self._status = self._status.model_copy(update={"last_error": error, "last_error_time": now()})
+                else:
+                    discarded_files = self._status.discarded_files  # shown until the next change is submitted
+                    self._status = CommitStatus(last_commit=commit_msg, last_commit_time=now(), discarded_files=discarded_files)
+                self._condition.notify_all()
@@ -29,8 +29,16 @@ class Auth(BaseModel):
     github_client: GithubClient
 
 
+class Cache(BaseModel):
+    github_client: str = ""  # directory of the local blob cache, empty disables caching
+    loot_seasons: int = 0  # seasons of loot logs kept in memory, least recently used ones are dropped, 0 keeps all
+    sqlite: str = ""  # file of the indexed sqlite mirror answering the queries, empty uses the in memory models
+    wcl_client: str = ""  # directory of the warcraftlogs access token and report responses, empty disables caching
+
+
 class ConfigRoot(BaseModel):
     auth: Auth
+    cache: Cache = Cache()
 
 
 class Config:
@@ -42,6 +50,7 @@ class Config:
 
     def __init__(self) -> None:
         self.auth: Auth
+        self.cache: Cache
 
     def __new__(cls):
         with cls._lock:
@@ -53,6 +62,7 @@ class Config:
     def _load_config(self):
         root = load_config()
         self.auth: Auth = root.auth
+        self.cache: Cache = root.cache
 
 
 def load_config():
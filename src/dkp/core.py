@@ -3,14 +3,15 @@ Data classes concentrated into a single file to omit cyclic imports.
 """
 
 import datetime
-import json
 import os
+from functools import cache
 
 import pytz
-from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from pydantic import BaseModel, Field, TypeAdapter, ValidationInfo, field_validator
 
 ORIGINAL = "original"
 CHANGE = "change"
+BID_RESPONSE = "Gebot"  # loot response of won bids, the only ones costing dkp
 
 
 def is_local_development() -> bool:
@@ -157,6 +158,27 @@ class RaidChecklist(BaseModel):
         return self.video_recording and self.logs_recording and self.rclc_installed and self.consumables
 
 
+class ImportIssue(BaseModel):
+    row: int  # position in the export starting at 1, 0 for the export as a whole
+    id: str = ""
+    message: str
+
+
+class LootImport(BaseModel):
+    new_loot: dict[str, list[RawLoot]] = {}  # raid day -> entries not imported before
+    skipped: int = 0  # entries imported before
+    issues: list[ImportIssue] = []
+
+
+class CommitStatus(BaseModel):
+    pending_files: list[str] = []
+    discarded_files: list[str] = []  # changed by someone else in the meantime
+    last_commit: str = ""
+    last_commit_time: str = ""
+    last_error: str = ""
+    last_error_time: str = ""
+
+
 class Balance(BaseModel):
     name: str
     value: int = 0
@@ -165,6 +187,15 @@ class Balance(BaseModel):
     characters: list[str]
 
 
+class SeasonArchive(BaseModel):
+    """Final state of a closed season, replaces its loot logs when reading."""
+
+    season: Season
+    raids: list[Raid]
+    loot: dict[str, list[Loot]]  # raid date -> cleaned loot, latest first
+    balance: list[Balance]
+
+
 class FightStats(BaseModel):
     id: int = 0
     size: int
@@ -182,10 +213,20 @@ class RaidStats(BaseModel):
     fights: list[FightStats]
 
 
-def to_raw_loot_list(content: str) -> list[RawLoot]:
+def to_raw_loot_list(content: str | bytes) -> list[RawLoot]:
     """Converts json str into raw loot lists."""
-    loot_list = json.loads(content)
-    return [RawLoot(**entry) for entry in loot_list]
+    return to_model_list(RawLoot, content)
+
+
+def to_model_list[T: BaseModel](clazz: type[T], content: str | bytes) -> list[T]:
+    """Converts a json array into a list of models, parsed and validated in a single pass."""
+    return _get_list_adapter(clazz).validate_json(content)
+
+
+@cache
+def _get_list_adapter[T: BaseModel](clazz: type[T]) -> TypeAdapter[list[T]]:
+    # building the validator is expensive, reuse it for every file
+    return TypeAdapter(list[clazz])
 
 
 def to_raw_date(date: str) -> str:
@@ -4,12 +4,25 @@ Client for interaction with github.com API
 
 # pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
 
+import base64
+import io
 import json
 import logging
-from threading import Lock
+import os
+import tarfile
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock, local
 from typing import Callable, Type
 
+import requests
+from commit_queue import CommitQueue
 from core import (
+    Balance,
+    CommitStatus,
     Fix,
     Loot,
     Player,
@@ -18,36 +31,290 @@ from core import (
     RaidStats,
     RawLoot,
     Season,
+    SeasonArchive,
     csv_to_list,
     dict_to_csv,
-    is_local_development,
+    to_model_list,
     to_raw_loot_list,
     to_timestamp,
 )
-from github import Auth, Github, UnknownObjectException
-from github.ContentFile import ContentFile
+from github import Auth, Github, InputGitTreeElement
+from github.GitCommit import GitCommit
+from sqlite_store import SqliteStore
+from storage import (
+    ARCHIVE_DIR,
+    DATA_DIR,
+    LOOT_LOG_DIR,
+    Snapshot,
+    Storage,
+    get_archived_loot_logs,
+    git_blob_sha,
+    is_data_file,
+    write_atomic,
+)
 
 log = logging.getLogger(__name__)
 
 USER_NAME = "oliverfischer83"
 REPO_NAME = "dkp"
+MAX_WORKERS = 8  # upper bound of parallel requests against github.com while loading
+MAX_SINGLE_BLOBS = 10  # more missing blobs are downloaded as one tarball instead of one by one
 
 
-class GithubClient:
+class BlobCache:
+    """Local content-addressed store of git blobs and of responses to conditional requests."""
+
+    def __init__(self, cache_dir: str):
+        self._cache_dir = cache_dir
+        self._lock = Lock()
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "trees"), exist_ok=True)
+
+    def get(self, blob_sha: str) -> bytes | None:
+        file_path = self._blob_path(blob_sha)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "rb") as file:
+            return file.read()
+
+    def put(self, blob_sha: str, content: bytes):
+        if git_blob_sha(content) != blob_sha:
+            log.warning(f"Content does not match blob {blob_sha}, not cached")
+            return
+        write_atomic(self._blob_path(blob_sha), content)
+
+    def get_tree(self, commit_sha: str) -> dict[str, str] | None:
+        file_path = os.path.join(self._cache_dir, "trees", f"{commit_sha}.json")
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def put_tree(self, commit_sha: str, blob_sha: dict[str, str]):
+        # the tree of a commit never changes, so it needs no revalidation
+        write_atomic(os.path.join(self._cache_dir, "trees", f"{commit_sha}.json"), json.dumps(blob_sha).encode("utf-8"))
+
+    def get_etag(self, url: str) -> tuple[str | None, str | None]:
+        entry = self._load_etags().get(url, {})
+        return entry.get("etag"), entry.get("value")
+
+    def put_etag(self, url: str, etag: str | None, value: str):
+        if not etag:
+            return
+        with self._lock:
+            etags = self._load_etags()
+            etags[url] = {"etag": etag, "value": value}
+            write_atomic(self._etag_path(), json.dumps(etags, indent=2).encode("utf-8"))
+
+    def _load_etags(self) -> dict:
+        if not os.path.exists(self._etag_path()):
+            return {}
+        with open(self._etag_path(), "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _etag_path(self) -> str:
+        return os.path.join(self._cache_dir, "etags.json")
+
+    def _blob_path(self, blob_sha: str) -> str:
+        return os.path.join(self._cache_dir, "blobs", blob_sha[:2], blob_sha)
+
 
-    def __init__(self, branch_name, token):
+class GithubStorage(Storage):
+    """Data files inside the branch of the github.com repository."""
+
+    def __init__(self, branch_name, token, bulk_sync=False, cache_dir=None):
         self._branch_name = branch_name
-        self._github_api = Github(auth=Auth.Token(token))
+        self._bulk_sync = bulk_sync  # load the whole data directory at once instead of file by file
+        self._blob_cache = BlobCache(cache_dir) if cache_dir else None
+        # no delay between read requests, otherwise the parallel loading is throttled to a sequential pace
+        self._github_api = Github(auth=Auth.Token(token), pool_size=MAX_WORKERS, seconds_between_requests=None)
         self._repo_api = None
+        self._head_commit = None
+        self._branch_ref = None
+
+    @property
+    def repo_api(self):
+        if self._repo_api is None:
+            self._repo_api = self._github_api.get_user(USER_NAME).get_repo(REPO_NAME)
+        return self._repo_api
+
+    def load(self) -> Snapshot:
+        commit_sha = self._get_branch_head()
+        blob_sha = self._get_data_tree(commit_sha) if self._bulk_sync else self._list_data_dir(commit_sha)
+        for file_path in get_archived_loot_logs(blob_sha):
+            del blob_sha[file_path]
+        content = self._get_blobs(commit_sha, blob_sha)
+        log.debug(f"Loaded snapshot {commit_sha} with {len(content)} files")
+        return Snapshot(commit_sha, blob_sha, content)
+
+    def _get_branch_head(self) -> str:
+        if self._blob_cache is None:
+            return self.repo_api.get_branch(self._branch_name).commit.sha
+        # conditional request, an unchanged branch is answered by "304 Not Modified" without payload and rate limit costs
+        url = f"{self.repo_api.url}/branches/{self._branch_name}"
+        etag, commit_sha = self._blob_cache.get_etag(url)
+        headers = {"If-None-Match": etag} if etag else None
+        requester = self.repo_api._requester  # pylint: disable=protected-access
+        response_headers, data = requester.requestJsonAndCheck("GET", url, headers=headers)
+        if data is None:
+            return commit_sha
+        commit_sha = data["commit"]["sha"]
+        self._blob_cache.put_etag(url, response_headers.get("etag"), commit_sha)
+        return commit_sha
+
+    def _get_data_tree(self, commit_sha: str) -> dict[str, str]:
+        if self._blob_cache is not None:
+            blob_sha = self._blob_cache.get_tree(commit_sha)
+            if blob_sha is not None:
+                return blob_sha
+        tree = self.repo_api.get_git_tree(commit_sha, recursive=True)
+        blob_sha = {e.path: e.sha for e in tree.tree if e.type == "blob" and is_data_file(e.path)}
+        if self._blob_cache is not None:
+            self._blob_cache.put_tree(commit_sha, blob_sha)
+        return blob_sha
+
+    def _list_data_dir(self, commit_sha: str) -> dict[str, str]:
+        # file by file: one request per directory, all directories of the same depth in parallel
+        result = {}
+        dir_list = [DATA_DIR.rstrip("/")]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            while dir_list:
+                next_dir_list = []
+                for file_list in executor.map(lambda dir_path: self.repo_api.get_contents(dir_path, ref=commit_sha), dir_list):
+                    for file in file_list:
+                        if file.type == "dir" and is_data_file(file.path + "/"):
+                            next_dir_list.append(file.path)
+                        elif file.type == "file" and is_data_file(file.path):
+                            result[file.path] = file.sha
+                dir_list = next_dir_list
+        return result
+
+    def _get_blobs(self, commit_sha: str, blob_sha: dict[str, str]) -> dict[str, bytes]:
+        content = {}
+        if self._blob_cache is not None:
+            for file_path, sha in blob_sha.items():
+                cached = self._blob_cache.get(sha)
+                if cached is not None:
+                    content[file_path] = cached
+        missing = [file_path for file_path in blob_sha if file_path not in content]
+        if not missing:
+            return content
+
+        if self._bulk_sync and len(missing) > MAX_SINGLE_BLOBS:
+            archive = _extract_data_dir(self._download_archive(commit_sha))
+            downloaded = {file_path: archive[file_path] for file_path in missing}
+        else:
+            _ = self.repo_api  # initialize before the workers start using it concurrently
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                blob_list = executor.map(self._download_blob, [blob_sha[file_path] for file_path in missing])
+                downloaded = dict(zip(missing, blob_list))
+        log.debug(f"Downloaded {len(downloaded)} of {len(blob_sha)} files")
+
+        if self._blob_cache is not None:
+            for file_path, file_content in downloaded.items():
+                self._blob_cache.put(blob_sha[file_path], file_content)
+        content.update(downloaded)
+        return content
+
+    def _download_archive(self, commit_sha: str) -> bytes:
+        archive_link = self.repo_api.get_archive_link("tarball", commit_sha)
+        response = requests.get(archive_link, timeout=60)
+        response.raise_for_status()
+        return response.content
+
+    def _download_blob(self, blob_sha: str) -> bytes:
+        return base64.b64decode(self.repo_api.get_git_blob(blob_sha).content)
+
+    def refresh(self, snapshot: Snapshot) -> list[str] | None:
+        head_sha = self._get_branch_head()
+        if head_sha == snapshot.commit_sha:
+            return []
+        comparison = self.repo_api.compare(snapshot.commit_sha, head_sha)
+        if comparison.status != "ahead":
+            log.info(f"Branch {comparison.status} from {snapshot.commit_sha}, reloading everything")
+            return None
+        changed, removed = {}, []
+        for file in comparison.files:
+            if is_data_file(file.filename):
+                if file.status == "removed":
+                    removed.append(file.filename)
+                else:
+                    changed[file.filename] = file.sha
+            if file.status == "renamed" and is_data_file(file.previous_filename):
+                removed.append(file.previous_filename)
+        for file_path in get_archived_loot_logs(snapshot.blob_sha.keys() | changed.keys()):
+            changed.pop(file_path, None)  # not downloaded, the update drops the loot logs of archived seasons
+        content = self._get_blobs(head_sha, changed)
+        snapshot.update({file_path: (content[file_path], blob_sha) for file_path, blob_sha in changed.items()}, removed, head_sha)
+        return sorted(set(removed) | changed.keys())
+
+    def commit(self, snapshot: Snapshot, files: dict[str, str], commit_msg: str):
+        # single commit via the git data api, instead of one commit per file via the contents api
+        parent = self._get_commit(snapshot.commit_sha)
+        elements = [InputGitTreeElement(file_path, "100644", "blob", content=content) for file_path, content in files.items()]
+        tree = self.repo_api.create_git_tree(elements, base_tree=parent.tree)
+        commit = self.repo_api.create_git_commit(commit_msg, tree, [parent])
+        # not forced, fails if the branch moved in the meantime instead of overwriting other commits
+        self._get_branch_ref().edit(commit.sha)
+        self._head_commit = commit
+        changed = {}
+        for file_path, content in files.items():
+            # keep snapshot and blob cache in line with the branch
+            data = content.encode("utf-8")
+            blob_sha = git_blob_sha(data)
+            changed[file_path] = (data, blob_sha)
+            if self._blob_cache is not None:
+                self._blob_cache.put(blob_sha, data)
+        snapshot.update(changed, commit_sha=commit.sha)
+        log.debug(f"Committed {commit.sha}: {list(files)}")
+
+    def _get_commit(self, commit_sha: str) -> GitCommit:
+        if self._head_commit is None or self._head_commit.sha != commit_sha:
+            self._head_commit = self.repo_api.get_git_commit(commit_sha)
+        return self._head_commit
+
+    def _get_branch_ref(self):
+        if self._branch_ref is None:
+            self._branch_ref = self.repo_api.get_git_ref(f"heads/{self._branch_name}")
+        return self._branch_ref
+
+
+class GithubClient:
+
+    def __init__(
+        self,
+        branch_name="",
+        token="",
+        bulk_sync=False,
+        cache_dir=None,
+        storage: Storage | None = None,
+        write_behind=False,
+        max_loot_seasons=0,
+        sqlite_path="",
+    ):
+        # github.com is the default storage, others are used for local development or as fallback
+        self._storage = storage if storage is not None else GithubStorage(branch_name, token, bulk_sync, cache_dir)
+        # commit in background, changes are applied to the models right away
+        self._commit_queue = CommitQueue(self._commit) if write_behind else None
+        self._snapshot = None
+        self._last_refresh = 0.0
+        self._batch = local()  # pending file writes of the current thread
         self._raid_checklist = None
         self._player_list = None
         self._season_list = None
         self._raid_list = None
-        self._raw_loot_list = None
+        self._season_loot = OrderedDict()  # season id -> loot logs by raid, least recently used first
+        self._max_loot_seasons = max_loot_seasons  # seasons kept in memory, 0 keeps all
+        self._index = {}  # lookup tables over the model lists, built on first use and dropped on every change
+        self._loot_sha = {}  # raid -> git blob sha of its loot log in _season_loot
+        self._clean_loot = {}  # git blob sha of a loot log -> cleaned loot, dropped when the players change
+        self._archive = {}  # season id -> archive of a closed season, loaded on first access
+        self._sqlite = SqliteStore(sqlite_path) if sqlite_path else None  # indexed mirror of the snapshot, answers the queries
         self._lock_player = Lock()
         self._lock_raid = Lock()
         self._lock_season = Lock()
         self._lock_loot = Lock()
+        self._lock_snapshot = Lock()
 
     @property
     def raid_checklist(self):
@@ -56,10 +323,12 @@ class GithubClient:
         return self._raid_checklist
 
     @property
-    def repo_api(self):
-        if self._repo_api is None:
-            self._repo_api = self._github_api.get_user(USER_NAME).get_repo(REPO_NAME)
-        return self._repo_api
+    def snapshot(self) -> Snapshot:
+        if self._snapshot is None:
+            with self._lock_snapshot:
+                if self._snapshot is None:
+                    self._snapshot = self._storage.load()
+        return self._snapshot
 
     @property
     def player_list(self):
@@ -80,50 +349,131 @@ class GithubClient:
         return self._raid_list
 
     @property
-    def raw_loot_list(self):
-        if self._raw_loot_list is None:
-            self._raw_loot_list = self._load_raw_loot_list()
-        return self._raw_loot_list
+    def raw_loot_list(self) -> dict[Season, dict[Raid, list[RawLoot]]]:
+        """Loot logs of all seasons having any, loads every season (prefer the per season methods)."""
+        result = {}
+        for season in self.season_list:
+            raid_dict = self._get_season_raw_loot(season)
+            if raid_dict:
+                result[season] = raid_dict
+        return result
+
+    def refresh(self, max_age: float = 0) -> list[str]:
+        """Reloads all data files changed since the last seen revision and returns their paths.
+
+        The check is skipped, if the last one is younger than max_age seconds.
+        """
+        if time.monotonic() - self._last_refresh < max_age:
+            return []
+        self._last_refresh = time.monotonic()
+        if self._commit_queue is not None and self._commit_queue.has_pending():
+            return []  # reloading would drop the changes not committed yet
+        snapshot = self.snapshot
+        with self._lock_snapshot:
+            result = self._storage.refresh(snapshot)
+        if result is None:
+            self._reset()  # reload everything on next access
+            return []
+        if result:
+            log.debug(f"Refreshed {snapshot.commit_sha}: {result}")
+            self._rehydrate(result)
+        return result
+
+    def _reset(self):
+        self._snapshot = None
+        self._player_list = None
+        self._season_list = None
+        self._raid_list = None
+        self._season_loot = OrderedDict()
+        self._index = {}
+        self._clean_loot = {}
+        self._archive = {}
 
-    def _load_raw_loot_list(self) -> dict[Season, dict[Raid, list[RawLoot]]]:
+    def _rehydrate(self, file_list: list[str]):
+        if _get_player_file() in file_list:
+            self._player_list = self._load_data(Player, _get_player_file(), self._lock_player)
+            self._clean_loot = {}
+        if _get_season_file() in file_list:
+            self._season_list = self._load_data(Season, _get_season_file(), self._lock_season)
+        if _get_raid_file() in file_list:
+            self._raid_list = self._load_data(Raid, _get_raid_file(), self._lock_raid)
+        self._index = {}
+        archive_changed = any(file_path.startswith(_get_archive_dir_path()) for file_path in file_list)
+        if archive_changed:
+            self._archive = {}
+        if _get_season_file() in file_list or _get_raid_file() in file_list or archive_changed:
+            # loot logs are keyed by season and raid, which might have changed, reload on next access
+            with self._lock_loot:
+                self._season_loot = OrderedDict()
+            return
+        for file_path in file_list:
+            if not file_path.startswith(_get_loot_log_dir_path("")):
+                continue
+            season_name, file_name = file_path.split("/")[-2:]
+            season = self._get_index("season_by_name", lambda: {s.name: s for s in reversed(self.season_list)}).get(season_name)
+            if season is None:
+                log.warning(f"Skipped {file_path}, no season {season_name} found")
+                continue  # not read by a full load either
+            raid_dict = self._season_loot.get(season.id)
+            if raid_dict is None or self.is_archived(season):
+                continue  # loaded from snapshot on first access
+            try:
+                raid = self.find_raid_by_date(file_name.split(".")[0])
+            except ValueError as e:
+                log.warning(f"Skipped {file_path}: {e}")
+                continue
+            snapshot = self.snapshot.freeze()
+            if file_path in snapshot.content:
+                raid_dict[raid] = to_raw_loot_list(snapshot.get_bytes(file_path))
+                self._loot_sha[raid] = snapshot.blob_sha[file_path]
+            else:
+                raid_dict.pop(raid, None)
+                self._loot_sha.pop(raid, None)
+
+    def _get_season_raw_loot(self, season: Season) -> dict[Raid, list[RawLoot]]:
         with self._lock_loot:
-            result = {}
-            for season in self.season_list:
-                dir_path = _get_loot_log_dir_path(season.name)
-                try:
-                    file_list = self.repo_api.get_contents(dir_path, ref=self._branch_name)
-                except UnknownObjectException:
-                    continue  # no loot logs for this season yet
-                if isinstance(file_list, ContentFile):
-                    file_list = [file_list]
-                raid_dict = {}
-                for file in reversed(file_list):  # get latest files first (only relevant for local development)
-                    content = file.decoded_content.decode("utf-8")
-                    raw_loot_list = to_raw_loot_list(content)
-                    raid_day = file.name.split(".")[0]
-                    raid = self.find_raid_by_date(raid_day)
-                    raid_dict[raid] = raw_loot_list
-                    if is_local_development() and len(raid_dict) >= 1:
-                        break
-                result[season] = raid_dict
-            return result
+            raid_dict = self._season_loot.get(season.id)
+            if raid_dict is None:
+                raid_dict = self._season_loot[season.id] = self._load_season_raw_loot(season)
+                self._evict_season_loot(season)
+            else:
+                self._season_loot.move_to_end(season.id)
+            return raid_dict
+
+    def _load_season_raw_loot(self, season: Season) -> dict[Raid, list[RawLoot]]:
+        result = {}
+        if self.is_archived(season):
+            return result  # read from the archive instead
+        snapshot = self.snapshot.freeze()
+        for file_path in reversed(snapshot.list_dir(_get_loot_log_dir_path(season.name))):  # latest first
+            raid = self.find_raid_by_date(file_path.split("/")[-1].split(".")[0])
+            result[raid] = to_raw_loot_list(snapshot.get_bytes(file_path))
+            self._loot_sha[raid] = snapshot.blob_sha[file_path]
+        log.debug(f"Loaded loot logs of season {season.name}")
+        return result
+
+    def _evict_season_loot(self, current: Season):
+        if not self._max_loot_seasons:
+            return
+        for season_id in list(self._season_loot):
+            if len(self._season_loot) <= self._max_loot_seasons:
+                break
+            season = self._get_season_by_id().get(season_id)
+            if season_id == current.id or (season is not None and self._has_uncommitted_loot(season)):
+                continue  # reloading from the snapshot would drop local changes
+            for raid in self._season_loot.pop(season_id):
+                self._clean_loot.pop(self._loot_sha.pop(raid, None), None)
+            log.debug(f"Evicted loot logs of season {season_id}")
+
+    def _has_uncommitted_loot(self, season: Season) -> bool:
+        return any(
+            self.snapshot.blob_sha.get(_get_loot_log_file_path(season.name, raid.date)) != self._loot_sha.get(raid)
+            for raid in self._season_loot[season.id]
+        )
 
     def _load_data[T](self, clazz: Type[T], file_path: str, lock: Lock) -> list[T]:
         with lock:
-            content = self._get_data_file_content(file_path)
-            return [clazz(**entry) for entry in json.loads(content)]
-
-    def _get_data_file_hash(self, file_path: str) -> str:
-        result = self.repo_api.get_contents(file_path, ref=self._branch_name)
-        if isinstance(result, list):
-            raise TypeError(f"Multiple files found for {file_path}")
-        return result.sha
-
-    def _get_data_file_content(self, file_path: str) -> str:
-        result = self.repo_api.get_contents(file_path, ref=self._branch_name)
-        if isinstance(result, list):
-            raise TypeError(f"Multiple files found for {file_path}")
-        return result.decoded_content.decode("utf-8")
+            return to_model_list(clazz, self.snapshot.get_bytes(file_path))
 
     def add_player(self, player_name: str):
         player_id = max([player.id for player in self.player_list]) + 1
@@ -136,42 +486,54 @@ class GithubClient:
         self._update_player_list()
 
     def update_player(self, fixes: list[Fix]):
+        player_by_id = self._get_player_by_id()
         for fix in fixes:
-            for player in self.player_list:
-                if player.id == int(fix.id):
-                    for e in fix.entries:
-                        if e.name == "name":
-                            player.name = e.value
-                        elif e.name == "chars":
-                            player.chars = csv_to_list(e.value)
-                        else:
-                            raise KeyError(f"Invalid key: {e.name}")  # sanity check
-                    break
+            player = player_by_id.get(int(fix.id))
+            if player is None:
+                continue
+            for e in fix.entries:
+                if e.name == "name":
+                    player.name = e.value
+                elif e.name == "chars":
+                    player.chars = csv_to_list(e.value)
+                else:
+                    raise KeyError(f"Invalid key: {e.name}")  # sanity check
         self._update_player_list()
 
     def add_raid(self, date: str):
+        self._check_raid_changeable(date)
         raid_id = max([raid.id for raid in self.raid_list]) + 1
         self.raid_list.append(Raid(id=raid_id, date=date, report_id="", player=[]))
         self._update_raid_list()
 
     def delete_raid(self, raid_date: str):
         raid = self.find_raid_by_date(raid_date)
+        self._check_raid_changeable(raid.date)
         self.raid_list.remove(raid)
         self._update_raid_list()
 
     def update_raid(self, fixes: list[Fix]):
+        raid_by_id = self._get_raid_by_id()
         for fix in fixes:
-            for raid in self.raid_list:
-                if raid.id == int(fix.id):
-                    for e in fix.entries:
-                        if e.name == "date":
-                            raid.date = e.value
-                        elif e.name == "report_id":
-                            raid.report_id = e.value
-                        elif e.name == "player":
-                            raid.player = csv_to_list(e.value)
-                        else:
-                            raise KeyError(f"Invalid key: {e.name}")
+            # all fixes are checked before the first one is applied
+            if int(fix.id) in raid_by_id:
+                self._check_raid_changeable(raid_by_id[int(fix.id)].date)
+                for e in fix.entries:
+                    if e.name == "date":
+                        self._check_raid_changeable(e.value)
+        for fix in fixes:
+            raid = raid_by_id.get(int(fix.id))
+            if raid is None:
+                continue
+            for e in fix.entries:
+                if e.name == "date":
+                    raid.date = e.value
+                elif e.name == "report_id":
+                    raid.report_id = e.value
+                elif e.name == "player":
+                    raid.player = csv_to_list(e.value)
+                else:
+                    raise KeyError(f"Invalid key: {e.name}")
         self._update_raid_list()
 
     def add_season(self, name: str):
@@ -185,66 +547,195 @@ class GithubClient:
         self._update_season_list()
 
     def update_season(self, fixes: list[Fix]):
+        season_by_id = self._get_season_by_id()
         for fix in fixes:
-            for season in self.season_list:
-                if season.id == int(fix.id):
-                    for e in fix.entries:
-                        if e.name == "name":
-                            season.name = e.value
-                        elif e.name == "desc":
-                            season.desc = e.value
-                        elif e.name == "start_date":
-                            season.start_date = e.value
-                        else:
-                            raise KeyError(f"Invalid key: {e.name}")  # sanity check
-                    break
+            season = season_by_id.get(int(fix.id))
+            if season is None:
+                continue
+            for e in fix.entries:
+                if e.name == "name":
+                    season.name = e.value
+                elif e.name == "desc":
+                    season.desc = e.value
+                elif e.name == "start_date":
+                    season.start_date = e.value
+                else:
+                    raise KeyError(f"Invalid key: {e.name}")  # sanity check
         self._update_season_list()
 
+    def _check_raid_changeable(self, raid_day: str):
+        season = self._find_season_by_date(raid_day)
+        if season is not None and self.is_archived(season):
+            raise ValueError(f"Season {season.name} is archived, its raids can't be changed anymore.")
+
     def _update_player_list(self):
-        file_path = _get_player_file()
-        file_hash = self._get_data_file_hash(file_path)
-        self.repo_api.update_file(file_path, "Update", data_to_json(self.player_list, "name"), file_hash, self._branch_name)
+        self._index = {}
+        self._clean_loot = {}
+        self._write_file(_get_player_file(), data_to_json(self.player_list, "name"), "Update")
 
     def _update_raid_list(self):
-        file_path = _get_raid_file()
-        file_hash = self._get_data_file_hash(file_path)
-        self.repo_api.update_file(file_path, "Update", data_to_json(self.raid_list, "date"), file_hash, self._branch_name)
+        self._index = {}
+        self._write_file(_get_raid_file(), data_to_json(self.raid_list, "date"), "Update")
 
     def _update_season_list(self):
-        file_path = _get_season_file()
-        file_hash = self._get_data_file_hash(file_path)
-        self.repo_api.update_file(file_path, "Update", data_to_json(self.season_list, "id"), file_hash, self._branch_name)
+        self._index = {}
+        self._write_file(_get_season_file(), data_to_json(self.season_list, "id"), "Update")
+
+    def _write_file(self, file_path: str, content: str, commit_msg: str, on_commit: Callable[[], None] | None = None):
+        pending_files = getattr(self._batch, "files", None)
+        if pending_files is not None:
+            # committed at the end of the batch, dropped together with on_commit if the batch fails
+            pending_files[file_path] = content
+            if on_commit is not None:
+                self._batch.on_commit.append(on_commit)
+        else:
+            self.commit_files({file_path: content}, commit_msg)
+            if on_commit is not None:
+                on_commit()
+
+    @contextmanager
+    def batch_commit(self, commit_msg: str):
+        """Collects all file writes of the current thread within the context and commits them together at the end.
+
+        Nothing is committed if the context raises. A nested batch joins the outer one.
+        """
+        if getattr(self._batch, "files", None) is not None:
+            yield
+            return
+        self._batch.files, self._batch.on_commit = {}, []
+        try:
+            yield
+            files, on_commit = self._batch.files, self._batch.on_commit
+        finally:
+            self._batch.files, self._batch.on_commit = None, None
+        if files:
+            self.commit_files(files, commit_msg)
+        for apply in on_commit:
+            apply()
+
+    def commit_files(self, files: dict[str, str], commit_msg: str):
+        """Commits all files as a single commit on top of the last seen revision."""
+        if self._commit_queue is not None:
+            self._commit_queue.submit(files, commit_msg)
+        else:
+            self._commit(files, commit_msg)
 
-    def get_season_loot_raw(self, season: Season) -> list[RawLoot]:
-        if season not in self.raw_loot_list:
+    def _commit(self, files: dict[str, str], commit_msg: str):
+        snapshot = self.snapshot
+        with self._lock_snapshot:
+            self._storage.commit(snapshot, files, commit_msg)
+
+    def get_commit_status(self) -> CommitStatus:
+        if self._commit_queue is None:
+            return CommitStatus()
+        return self._commit_queue.status()
+
+    def retry_commits(self) -> list[str]:
+        """Commits the pending changes on top of the current head, returns the files discarded due to conflicts."""
+        if self._commit_queue is None:
             return []
+        # the branch might have moved in the meantime, commit on top of its new head
+        pending_files = self._commit_queue.status().pending_files
+        snapshot = self.snapshot
+        with self._lock_snapshot:
+            changed_files = self._storage.refresh(snapshot) or []
+        # pending changes of files changed by someone else are rejected instead of overwriting them
+        result = self._commit_queue.discard([file_path for file_path in changed_files if file_path in pending_files])
+        if result:
+            log.warning(f"Discarded local changes, changed by someone else in the meantime: {result}")
+        still_pending = set(pending_files) - set(result)
+        if changed_files:
+            self._rehydrate([file_path for file_path in changed_files if file_path not in still_pending])
+        self._commit_queue.retry()
+        return result
+
+    def get_season_loot_raw(self, season: Season) -> list[RawLoot]:
+        store = self._get_sqlite()
+        if store is not None and not self.is_archived(season):
+            return store.get_season_loot_raw(season)
         result = []
-        for _, loot_list in self.raw_loot_list[season].items():
+        for loot_list in self._get_season_raw_loot(season).values():
             result.extend(loot_list)
         return result
 
+    def get_season_loot_raw_by_raid(self, season: Season) -> dict[Raid, list[RawLoot]]:
+        return dict(self._get_season_raw_loot(season))
+
     def get_raid_loot_raw(self, raid_day: str) -> list[RawLoot]:
         raid = self.find_raid_by_date(raid_day)
         season = self.find_season_by_raid(raid)
-        for raid, loot_list in self.raw_loot_list[season].items():
-            if raid.date == raid_day:
-                return loot_list
-        return []
+        return self._get_season_raw_loot(season).get(raid, [])
 
     def get_raid_loot(self, raid_day: str) -> list[Loot]:
-        raid_loot = self.get_raid_loot_raw(raid_day)
-        return self._cleaning(raid_loot)
+        raid = self.find_raid_by_date(raid_day)
+        return self.get_clean_loot(self.find_season_by_raid(raid), raid)
 
     def get_season_loot(self, season: Season) -> list[Loot]:
-        season_loot = self.get_season_loot_raw(season)
-        return self._cleaning(season_loot)
+        result = []
+        if self.is_archived(season):
+            for raid_loot in self.get_archive(season).loot.values():
+                result.extend(raid_loot)
+        else:
+            for raid, raid_loot in self._get_season_raw_loot(season).items():
+                result.extend(self._get_clean_loot(raid, raid_loot))
+        # each raid is sorted already, same order as cleaning the whole season at once
+        return sorted(result, key=lambda entry: entry.timestamp, reverse=True)
+
+    def get_clean_loot(self, season: Season, raid: Raid) -> list[Loot]:
+        if self.is_archived(season):
+            return list(self.get_archive(season).loot.get(raid.date, []))
+        return self._get_clean_loot(raid, self._get_season_raw_loot(season).get(raid, []))
+
+    def get_loot_revisions(self, season: Season) -> dict[Raid, str | None]:
+        """Identifies the content of each loot log of the season, None if unknown."""
+        if self.is_archived(season):
+            revision = self.snapshot.blob_sha.get(_get_archive_file_path(season.name))
+            return {self.find_raid_by_date(raid_day): revision for raid_day in self.get_archive(season).loot}
+        return {raid: self._loot_sha.get(raid) for raid in self._get_season_raw_loot(season)}
+
+    def is_archived(self, season: Season) -> bool:
+        return _get_archive_file_path(season.name) in self.snapshot.content
+
+    def get_archive(self, season: Season) -> SeasonArchive:
+        archive = self._archive.get(season.id)
+        if archive is None:
+            content = self.snapshot.get_bytes(_get_archive_file_path(season.name))
+            archive = self._archive[season.id] = SeasonArchive.model_validate_json(content)
+        return archive
+
+    def archive_season(self, season: Season, balance: list[Balance]):
+        """Stores the final state of a closed season, its loot logs are not read anymore afterwards."""
+        if not any(s.start_date > season.start_date for s in self.season_list):
+            raise ValueError(f"Season {season.name} is not closed yet.")
+        archive = SeasonArchive(
+            season=season,
+            raids=self.get_raid_list(season),
+            loot={raid.date: self.get_clean_loot(season, raid) for raid in self._get_season_raw_loot(season)},
+            balance=balance,
+        )
+        self._write_file(_get_archive_file_path(season.name), archive.model_dump_json(), "Archive")
+        self._archive[season.id] = archive
+        with self._lock_loot:
+            for raid in self._season_loot.pop(season.id, {}):
+                self._clean_loot.pop(self._loot_sha.pop(raid, None), None)
+
+    def _get_clean_loot(self, raid: Raid, raid_loot: list[RawLoot]) -> list[Loot]:
+        blob_sha = self._loot_sha.get(raid)
+        if blob_sha is None:
+            return self._cleaning(raid_loot)
+        result = self._clean_loot.get(blob_sha)
+        if result is None:
+            result = self._clean_loot[blob_sha] = self._cleaning(raid_loot)
+        return list(result)
 
     def _cleaning(self, raw_loot: list[RawLoot]) -> list[Loot]:
         result = []
+        player_by_character = self._get_player_by_character()
         for raw_entry in raw_loot:
-            player_name = self.find_player_by_character(
-                raw_entry.player
-            ).name  # raw_entry.player is actually the character name not the player name
+            player = player_by_character.get(raw_entry.player)  # raw_entry.player is actually the character name not the player name
+            if player is None:
+                raise ValueError(f"No player found having character {raw_entry.player}")
+            player_name = player.name
             entry = Loot(
                 id=raw_entry.id,
                 timestamp=to_timestamp(raw_entry.date + " " + raw_entry.time),
@@ -262,32 +753,21 @@ class GithubClient:
             result.append(entry)
         return sorted(result, key=lambda entry: entry.timestamp, reverse=True)
 
-    def _get_season_end(self, season: Season) -> str | None:
-        next_season = self._get_next_season(season)
-        if next_season:
-            return next_season.start_date
-        else:
-            return None
-
-    def _get_next_season(self, season: Season) -> Season | None:
-        sorted_list = sorted(self.season_list, key=lambda season: season.start_date)
-        for i, s in enumerate(sorted_list):
-            if s == season:
-                if i + 1 < len(sorted_list):
-                    return sorted_list[i + 1]
-        return None
-
     def get_raid_list(self, season: Season) -> list[Raid]:
-        season_end = self._get_season_end(season)
-        if season_end:
-            return [raid for raid in self.raid_list if season.start_date <= raid.date < season_end]
-        else:
-            return [raid for raid in self.raid_list if season.start_date <= raid.date]
+        if self.is_archived(season):
+            return list(self.get_archive(season).raids)
+        store = self._get_sqlite()
+        if store is not None:
+            return store.get_raid_list(season)
+        return list(self._get_raid_by_season().get(season.id, []))
 
     def get_empty_season_list(self) -> list[Season]:
         result = []
         for season in self.season_list:
-            if season not in self.raw_loot_list:
+            if self.is_archived(season):
+                continue  # loot logs are in the archive
+            # no loot logs, neither committed nor pending
+            if not self.snapshot.list_dir(_get_loot_log_dir_path(season.name)) and not self._season_loot.get(season.id):
                 result.append(season)
         return result
 
@@ -301,69 +781,152 @@ class GithubClient:
 
     def get_empty_raid_list(self, season: Season) -> list[Raid]:
         result = []
+        if self.is_archived(season):
+            return [raid for raid in self.get_raid_list(season) if raid.date not in self.get_archive(season).loot]
         for raid in self.get_raid_list(season):
             # raid has no loot log yet
-            if raid not in self.raw_loot_list[season]:
+            if raid not in self._get_season_raw_loot(season):
                 result.append(raid)
         return result
 
     def find_season_by_raid(self, raid: Raid) -> Season:
-        for season in sorted(self.season_list, key=lambda season: season.start_date, reverse=True):
-            if season.start_date <= raid.date:
-                return season
-        raise ValueError(f"No season found for raid {raid.date}")
+        store = self._get_sqlite()
+        if store is not None:
+            return store.find_season_by_raid(raid)
+        season = self._find_season_by_date(raid.date)
+        if season is None:
+            raise ValueError(f"No season found for raid {raid.date}")
+        return season
+
+    def _find_season_by_date(self, raid_day: str) -> Season | None:
+        start_dates, seasons = self._get_season_intervals()
+        i = bisect_right(start_dates, raid_day) - 1
+        if i < 0:
+            return None
+        # the first listed season wins, if several start at the same day
+        return seasons[bisect_left(start_dates, start_dates[i])]
 
     def find_raid_by_date(self, raid_day: str) -> Raid:
-        for raid in self.raid_list:
-            if raid.date == raid_day:
-                return raid
-        raise ValueError(f"No raid found for {raid_day}")
+        store = self._get_sqlite()
+        if store is not None:
+            return store.find_raid_by_date(raid_day)
+        raid = self._get_index("raid_by_date", lambda: {r.date: r for r in reversed(self.raid_list)}).get(raid_day)
+        if raid is None:
+            raise ValueError(f"No raid found for {raid_day}")
+        return raid
+
+    def find_raid_by_id(self, raid_id: int) -> Raid:
+        raid = self._get_raid_by_id().get(raid_id)
+        if raid is None:
+            raise ValueError(f"No raid found for id {raid_id}")
+        return raid
+
+    def find_season_by_id(self, season_id: int) -> Season:
+        season = self._get_season_by_id().get(season_id)
+        if season is None:
+            raise ValueError(f"No season found for id {season_id}")
+        return season
+
+    def find_player_by_id(self, player_id: int) -> Player:
+        player = self._get_player_by_id().get(player_id)
+        if player is None:
+            raise ValueError(f"No player found for id {player_id}")
+        return player
 
     def find_player_by_name(self, player_name: str) -> Player:
-        for player in self.player_list:
-            if player.name == player_name:
-                return player
-        raise ValueError(f"No player found for {player_name}")
+        player = self._get_index("player_by_name", lambda: {p.name: p for p in reversed(self.player_list)}).get(player_name)
+        if player is None:
+            raise ValueError(f"No player found for {player_name}")
+        return player
 
     def find_player_by_character(self, char_name: str) -> Player:
-        for player in self.player_list:
-            if char_name in player.chars:
-                return player
-        raise ValueError(f"No player found having character {char_name}")
+        store = self._get_sqlite()
+        if store is not None:
+            return store.find_player_by_character(char_name)
+        player = self._get_player_by_character().get(char_name)
+        if player is None:
+            raise ValueError(f"No player found having character {char_name}")
+        return player
+
+    def _get_sqlite(self) -> SqliteStore | None:
+        """The sqlite mirror if enabled and the snapshot holds all changes, the models are used while changes wait for their commit."""
+        if self._sqlite is None or getattr(self._batch, "files", None) is not None:
+            return None
+        if self._commit_queue is not None and self._commit_queue.has_pending():
+            return None
+        self._sqlite.sync(self.snapshot)
+        return self._sqlite
+
+    def _get_raid_by_id(self) -> dict[int, Raid]:
+        return self._get_index("raid_by_id", lambda: {r.id: r for r in reversed(self.raid_list)})
+
+    def _get_season_by_id(self) -> dict[int, Season]:
+        return self._get_index("season_by_id", lambda: {s.id: s for s in reversed(self.season_list)})
+
+    def _get_player_by_id(self) -> dict[int, Player]:
+        return self._get_index("player_by_id", lambda: {p.id: p for p in reversed(self.player_list)})
+
+    def _get_player_by_character(self) -> dict[str, Player]:
+        # the first player wins, if a character is assigned to several players
+        return self._get_index("player_by_character", lambda: {c: p for p in reversed(self.player_list) for c in p.chars})
+
+    def _get_season_intervals(self) -> tuple[list[str], list[Season]]:
+        # seasons ordered by start, each one lasts until the next one starts
+        def build():
+            seasons = sorted(self.season_list, key=lambda season: season.start_date)
+            return [season.start_date for season in seasons], seasons
+
+        return self._get_index("season_intervals", build)
+
+    def _get_raid_by_season(self) -> dict[int, list[Raid]]:
+        def build():
+            start_dates, seasons = self._get_season_intervals()
+            result = {}
+            for raid in self.raid_list:
+                i = bisect_right(start_dates, raid.date) - 1
+                if i >= 0:
+                    result.setdefault(seasons[i].id, []).append(raid)
+            return result
+
+        return self._get_index("raid_by_season", build)
+
+    def _get_index[T](self, name: str, build: Callable[[], T]) -> T:
+        index = self._index.get(name)
+        if index is None:
+            index = self._index[name] = build()
+        return index
 
     def update_raid_checklist(self, checklist: RaidChecklist):
         self._raid_checklist = checklist
 
     def create_loot_log(self, content: list[RawLoot], raid_day: str):
-        def _create_loot_log(file_path: str, content: str, commit_msg: str):
-            self.repo_api.create_file(file_path, commit_msg, content, self._branch_name)
-
-        self._handle_github_file(content, raid_day, "Create", _create_loot_log)
-
-    def _update_loot_log(self, file_path: str, content: str, commit_msg: str):
-        file_hash = self._get_data_file_hash(file_path)
-        self.repo_api.update_file(file_path, commit_msg, content, file_hash, self._branch_name)
+        self._handle_github_file(content, raid_day, "Create")
 
     def update_loot_log(self, content: list[RawLoot], raid_day: str):
-        self._handle_github_file(content, raid_day, "Update", self._update_loot_log)
+        self._handle_github_file(content, raid_day, "Update")
 
     def fix_loot_log(self, content: list[RawLoot], raid_day: str, reason: str):
-        self._handle_github_file(content, raid_day, f"Fix: {reason}", self._update_loot_log)
+        self._handle_github_file(content, raid_day, f"Fix: {reason}")
 
-    def _handle_github_file(self, content: list[RawLoot], raid_day: str, commit_msg: str, specific_handling_func: Callable):
+    def _handle_github_file(self, content: list[RawLoot], raid_day: str, commit_msg: str):
         season = self.find_season_by_raid(self.find_raid_by_date(raid_day))
+        if self.is_archived(season):
+            raise ValueError(f"Season {season.name} is archived, loot logs can't be changed anymore.")
         file_path = _get_loot_log_file_path(season.name, raid_day)
-        # update file on github
-        specific_handling_func(file_path, to_raw_loot_json(content), commit_msg)
-        # update loot list
+        file_content = to_raw_loot_json(content)
         raid = self.find_raid_by_date(raid_day)
-        self.raw_loot_list[season][raid] = content
+
+        # loot list follows the file once it's committed, within a batch at its end
+        def update_loot_list():
+            self._get_season_raw_loot(season)[raid] = content
+            # entries might have been changed in place, the hash of the written content identifies them
+            self._clean_loot.pop(self._loot_sha.get(raid), None)
+            self._loot_sha[raid] = git_blob_sha(file_content.encode("utf-8"))
+
+        self._write_file(file_path, file_content, commit_msg, on_commit=update_loot_list)
 
     def create_raid_excel_file(self, balance: dict[str, str]):
-        file_path = _get_balance_fallback_file()
-        file_hash = self._get_data_file_hash(file_path)
-        content = dict_to_csv(balance)
-        self.repo_api.update_file(file_path, "Update", content, file_hash, self._branch_name)
+        self._write_file(_get_balance_fallback_file(), dict_to_csv(balance), "Update")
 
 
 def _get_raid_file():
@@ -382,12 +945,33 @@ def _get_balance_fallback_file():
     return "data/balance_fallback.csv"
 
 
+def _get_archive_dir_path():
+    return ARCHIVE_DIR
+
+
+def _get_archive_file_path(season: str):
+    return f"{_get_archive_dir_path()}{season}.json"
+
+
 def _get_loot_log_dir_path(season: str):
-    return f"data/season/{season}"
+    return f"{LOOT_LOG_DIR}{season}"
 
 
 def _get_loot_log_file_path(season: str, raid_day: str):
-    return f"data/season/{season}/{raid_day}.json"
+    return f"{LOOT_LOG_DIR}{season}/{raid_day}.json"
+
+
+def _extract_data_dir(archive: bytes) -> dict[str, bytes]:
+    """Extracts all files of the data directory from a github tarball."""
+    result = {}
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            file_path = member.name.split("/", 1)[-1]  # strip root folder like "oliverfischer83-dkp-1a2b3c4"
+            if is_data_file(file_path):
+                result[file_path] = tar.extractfile(member).read()
+    return result
 
 
 def to_raw_loot_json(loot_list: list[RawLoot]) -> str:
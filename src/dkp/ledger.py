@@ -0,0 +1,161 @@
+"""
+Balance of all players per season, maintained raid by raid instead of recomputed from the whole loot history.
+"""
+
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+
+import logging
+from bisect import bisect_right
+from collections import Counter
+from threading import Lock
+from typing import Callable
+
+from core import BID_RESPONSE, Balance, Loot, Player, Raid, Season
+from github_client import GithubClient
+
+log = logging.getLogger(__name__)
+
+
+class SeasonLedger:
+    """Attendance per player and cost per character of a single season, with the share of each raid."""
+
+    def __init__(self):
+        self.attendance: Counter[str] = Counter()  # player name -> number of attended raids
+        self.cost: Counter[str] = Counter()  # character -> dkp spent
+        self.raid_attendance: dict[int, tuple[tuple, Counter[str]]] = {}  # raid id -> ((date, attendees), share)
+        self.raid_cost: dict[int, tuple[tuple, Counter[str]]] = {}  # raid id -> ((date, loot log revision), share)
+        self._history = None  # prefix sums per raid date, built on first use after a change
+
+    def update_attendance(self, raid_list: list[Raid]) -> int:
+        """Applies the attendees of changed, new and removed raids, returns the number of raids applied."""
+        changed = 0
+        raid_ids = set()
+        for raid in raid_list:
+            raid_ids.add(raid.id)
+            key = (raid.date, tuple(raid.player))
+            entry = self.raid_attendance.get(raid.id)
+            if entry is not None and entry[0] == key:
+                continue
+            if entry is not None:
+                self.attendance.subtract(entry[1])
+            share = Counter(raid.player)
+            self.attendance.update(share)
+            self.raid_attendance[raid.id] = (key, share)
+            changed += 1
+        for raid_id in [raid_id for raid_id in self.raid_attendance if raid_id not in raid_ids]:
+            self.attendance.subtract(self.raid_attendance.pop(raid_id)[1])
+            changed += 1
+        if changed:
+            self._history = None
+        return changed
+
+    def update_cost(self, revisions: dict[Raid, str | None], get_raid_loot: Callable[[Raid], list[Loot]]) -> int:
+        """Applies the loot of changed, new and removed loot logs, returns the number of loot logs applied."""
+        changed = 0
+        raid_ids = set()
+        for raid, revision in revisions.items():
+            raid_ids.add(raid.id)
+            key = (raid.date, revision)
+            entry = self.raid_cost.get(raid.id)
+            if entry is not None and revision is not None and entry[0] == key:
+                continue
+            if entry is not None:
+                self.cost.subtract(entry[1])
+            share = to_character_cost(get_raid_loot(raid))
+            self.cost.update(share)
+            self.raid_cost[raid.id] = (key, share)
+            changed += 1
+        for raid_id in [raid_id for raid_id in self.raid_cost if raid_id not in raid_ids]:
+            self.cost.subtract(self.raid_cost.pop(raid_id)[1])
+            changed += 1
+        if changed:
+            self._history = None
+        return changed
+
+    def get_dates(self) -> list[str]:
+        return self._get_history()[0]
+
+    def as_of(self, date: str) -> tuple[Counter[str], Counter[str]]:
+        """Attendance and cost of all raids up to and including the date."""
+        dates, totals = self._get_history()
+        i = bisect_right(dates, date) - 1
+        return totals[i] if i >= 0 else (Counter(), Counter())
+
+    def _get_history(self) -> tuple[list[str], list[tuple[Counter[str], Counter[str]]]]:
+        if self._history is None:
+            shares = [(key[0], share, Counter()) for key, share in self.raid_attendance.values()]
+            shares += [(key[0], Counter(), share) for key, share in self.raid_cost.values()]
+            shares.sort(key=lambda entry: entry[0])
+            dates, totals = [], []
+            attendance, cost = Counter(), Counter()
+            for date, attendance_share, cost_share in shares:
+                attendance.update(attendance_share)
+                cost.update(cost_share)
+                if dates and dates[-1] == date:
+                    totals[-1] = (attendance.copy(), cost.copy())
+                else:
+                    dates.append(date)
+                    totals.append((attendance.copy(), cost.copy()))
+            self._history = (dates, totals)
+        return self._history
+
+
+class BalanceLedger:
+    """Balances of all seasons, kept up to date with the database on every read.
+
+    Only raids whose attendees or loot log changed since the last read are applied again, everything else is
+    taken from the ledger. rebuild() starts over from the whole history, e.g. to verify the ledger.
+    """
+
+    def __init__(self, database: GithubClient, initial_balance: int, attendance_bonus: int):
+        self._database = database
+        self._initial_balance = initial_balance
+        self._attendance_bonus = attendance_bonus
+        self._seasons: dict[int, SeasonLedger] = {}  # season id -> ledger
+        self._lock = Lock()
+
+    def get_balance(self, season: Season, as_of: str | None = None) -> list[Balance]:
+        """Balance of all players at the end of the season, or after the raids up to and including a date."""
+        with self._lock:
+            ledger = self._update(season)
+            attendance, cost = (ledger.attendance, ledger.cost) if as_of is None else ledger.as_of(as_of)
+            return [self._to_balance(player, attendance, cost) for player in self._database.player_list]
+
+    def get_balance_history(self, season: Season, player: Player) -> dict[str, Balance]:
+        """Balance of the player after each raid day of the season."""
+        with self._lock:
+            ledger = self._update(season)
+            return {date: self._to_balance(player, *ledger.as_of(date)) for date in ledger.get_dates()}
+
+    def get_dates(self, season: Season) -> list[str]:
+        with self._lock:
+            return list(self._update(season).get_dates())
+
+    def _update(self, season: Season) -> SeasonLedger:
+        ledger = self._seasons.setdefault(season.id, SeasonLedger())
+        changed = ledger.update_attendance(self._database.get_raid_list(season))
+        revisions = self._database.get_loot_revisions(season)
+        changed += ledger.update_cost(revisions, lambda raid: self._database.get_clean_loot(season, raid))
+        if changed:
+            log.debug(f"Applied {changed} changed raids to the balance of {season.name}")
+        return ledger
+
+    def _to_balance(self, player: Player, attendance: Counter[str], cost: Counter[str]) -> Balance:
+        income = self._initial_balance + self._attendance_bonus * attendance[player.name]
+        player_cost = sum(cost[char] for char in set(player.chars))
+        return Balance(name=player.name, value=income - player_cost, income=income, cost=-player_cost, characters=player.chars)
+
+    def rebuild(self, season: Season | None = None):
+        with self._lock:
+            if season is None:
+                self._seasons = {}
+            else:
+                self._seasons.pop(season.id, None)
+
+
+def to_character_cost(loot_list: list[Loot]) -> Counter[str]:
+    result = Counter()
+    for loot in loot_list:
+        if loot.response == BID_RESPONSE:
+            result[loot.character] += int(loot.note)
+    return result
@@ -0,0 +1,111 @@
+"""
+Checks a loot log exported by RCLootCouncil in a single pass, reporting all issues at once.
+"""
+
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+
+import json
+from typing import Callable
+
+from core import BID_RESPONSE, ImportIssue, LootImport, RawLoot, to_date
+from pydantic import ValidationError
+
+
+def check_loot_export(
+    content: str,
+    get_existing_ids: Callable[[str], set[str]],
+    known_characters: set[str],
+    get_locked_reason: Callable[[str], str | None] = lambda raid_day: None,
+) -> LootImport:
+    """Finds the new entries of the export per raid day, entries already stored for a raid day are skipped without checking them.
+
+    The export may span several raid days, e.g. after a missed week, get_existing_ids raises a ValueError for unknown raid days.
+    New entries of raid days which can't be changed anymore, e.g. of archived seasons, are reported with get_locked_reason.
+    """
+    try:
+        entries = json.loads(content)
+    except json.JSONDecodeError as e:
+        return LootImport(issues=[ImportIssue(row=0, message=f"Invalid JSON: {e}")])
+    if not isinstance(entries, list) or not entries:
+        return LootImport(issues=[ImportIssue(row=0, message="Empty list. Updated same list before?")])
+
+    result = LootImport()
+    raid_days: dict[str, list[tuple[int, RawLoot]]] = {}  # raid day -> (row, entry)
+    for row, entry in enumerate(entries, start=1):
+        try:
+            loot = RawLoot.model_validate(entry)
+        except ValidationError as e:
+            entry_id = str(entry.get("id", "")) if isinstance(entry, dict) else ""
+            result.issues.append(ImportIssue(row=row, id=entry_id, message=_to_message(e)))
+            continue
+        try:
+            raid_day = to_date(loot.date)
+        except ValueError as e:
+            result.issues.append(ImportIssue(row=row, id=loot.id, message=str(e)))
+            continue
+        raid_days.setdefault(raid_day, []).append((row, loot))
+
+    seen_ids = set()  # ids are unique across all raid days
+    for raid_day, day_entries in sorted(raid_days.items()):
+        try:
+            existing_ids = get_existing_ids(raid_day)
+        except ValueError as e:
+            result.issues.extend(ImportIssue(row=row, id=loot.id, message=str(e)) for row, loot in day_entries)
+            continue
+        locked_reason = get_locked_reason(raid_day)
+        for row, loot in day_entries:
+            if loot.id in existing_ids:
+                result.skipped += 1
+                continue
+            if locked_reason:
+                result.issues.append(ImportIssue(row=row, id=loot.id, message=locked_reason))
+                continue
+            issues = _check_entry(loot, seen_ids, known_characters)
+            result.issues.extend(ImportIssue(row=row, id=loot.id, message=message) for message in issues)
+            seen_ids.add(loot.id)
+            result.new_loot.setdefault(raid_day, []).append(loot)
+
+    if not result.new_loot and not result.issues:
+        result.issues.append(ImportIssue(row=0, message="Empty list. Updated same list before?"))
+    result.issues.sort(key=lambda issue: issue.row)
+    return result
+
+
+def check_character(character: str, known_characters: set[str]) -> str | None:
+    """Rules shared by importing and fixing loot, return the issue or None."""
+    if character not in known_characters:
+        return "Unknown character: " + character
+    return None
+
+
+def check_note(note: str) -> str | None:
+    if note.strip() == "":
+        return None
+    try:
+        value = int(note)
+    except ValueError:
+        return "Note must be a parsable integer, but was: " + note
+    if value < 10:
+        return "Note minimum is 10, but was: " + note
+    if value % 10 != 0:
+        return "Note must be within steps of 10, but was: " + note
+    return None
+
+
+def _check_entry(loot: RawLoot, seen_ids: set[str], known_characters: set[str]) -> list[str]:
+    result = []
+    if loot.id in seen_ids:
+        result.append(f'Duplicate id found! (id="{loot.id}").')
+    character_issue = check_character(loot.player, known_characters)
+    if character_issue:
+        result.append(character_issue)
+    if loot.note.strip() == "" and loot.response == BID_RESPONSE:
+        result.append(f'Respone is "{BID_RESPONSE}" but empty note! (id="{loot.id}").')
+    note_issue = check_note(loot.note)
+    if note_issue:
+        result.append(note_issue)
+    return result
+
+
+def _to_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" for e in error.errors())
@@ -1,11 +1,11 @@
 # pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
 
-import time
-
 import app
 import pandas as pd
 import streamlit as st
-from core import CHANGE, ORIGINAL, Fix, FixEntry, list_to_csv, to_date, to_raw_loot_list
+from core import CHANGE, ORIGINAL, Fix, FixEntry, list_to_csv
+
+WHOLE_SEASON = "whole season"
 
 
 def main():
@@ -44,19 +44,25 @@ def build_sidebar():
         with col1:
             if st.button("Start Raid", disabled=app.is_raid_started()):
                 app.start_raid()
-                st.success("Raid started.")
-                time.sleep(2)
+                st.toast("Raid started.")
                 st.rerun()
         with col2:
             if st.button("Stop Raid", disabled=app.is_raid_stopped()):
                 try:
                     app.stop_raid()
-                    st.success("Raid stopped.")
-                    time.sleep(2)
+                    st.toast("Raid stopped.")
                     st.rerun()
                 except ValueError as e:
                     st.error(str(e))
 
+        # commits running in background
+        build_commit_status()
+
+        # changes by other admins
+        if st.button("Refresh data"):
+            changed_files = app.refresh_data(force=True)
+            st.success(f"Files reloaded: {len(changed_files)}")
+
         # checklist
         if app.is_raid_started():
             checklist = app.get_raid_checklist()
@@ -76,12 +82,34 @@ def build_sidebar():
         st.write(f"###### Version: {app.PROJECT_VERSION}")
 
 
+def build_commit_status():
+    status = app.get_commit_status()
+    if status.discarded_files:
+        st.warning(f"Changed by someone else in the meantime, your changes were discarded: {", ".join(status.discarded_files)}")
+    if status.last_error:
+        st.error(f"Saving failed ({status.last_error_time}): {status.last_error}")
+        if st.button("Retry saving"):
+            app.retry_commits()
+            st.rerun()
+    elif status.pending_files:
+        st.info(f"Saving: {", ".join(status.pending_files)}")
+    elif status.last_commit:
+        st.caption(f"Saved ({status.last_commit_time}): {status.last_commit}")
+
+
 def build_notification_area():
     with st.container():
         st.write("")  # strange: this element is necessary, otherwise all expander on the page collapse after any button pressed
         unfinished_raids = app.find_past_raids_without_attendees()
         if unfinished_raids:
             st.error("Missing attendees for raids: " + ", ".join(unfinished_raids))
+            if st.button("Get missing attendees from warcraftlogs.com"):
+                try:
+                    filled_raids = app.fill_missing_attendees()
+                    st.toast(f"Attendees updated: {list_to_csv(filled_raids)}" if filled_raids else "No report id found for these raids.")
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
 
 
 def build_loot_upload():
@@ -91,21 +119,25 @@ def build_loot_upload():
                 "Add Loot Log (RCLootCouncil export as JSON):", placeholder='e.g. [{"player":"Moppi-Anub\'Arak", "date":"31/1/24", ...'
             )
             if st.button("Try submit ..."):
-                uploaded_log = to_raw_loot_list(json_string)
-                raid_day = to_date(uploaded_log[0].date)
-                existing_log = app.get_raid_loot_raw(raid_day)
-                new_log = app.filter_logs(existing_log, uploaded_log)
-                try:
-                    # only validate the new loot, the existing loot in the json export could be invalid and was cleaned up before
-                    # only the new loot is stored into the database
-                    app.validate_import(new_log)
-
-                    # upload clean logs
-                    clean_logs = app.merging_logs(existing_log, new_log)
-                    app.upload_loot_log(clean_logs)
-                    st.success("Loot log uploaded.")
-                except ValueError as e:
-                    st.error(f"Validation failed! {str(e)}")
+                # only the new loot is validated and stored, the existing loot in the json export could be invalid and was cleaned up before
+                loot_import = app.check_loot_import(json_string)
+                if loot_import.issues:
+                    st.error(f"Validation failed! {len(loot_import.issues)} issues found:")
+                    st.dataframe(
+                        pd.DataFrame([issue.model_dump() for issue in loot_import.issues], columns=["row", "id", "message"]),
+                        column_config={"row": "Row", "id": "Id", "message": "Issue"},
+                        hide_index=True,
+                    )
+                else:
+                    try:
+                        app.import_loot(loot_import)
+                        new_entries = sum(len(new_loot) for new_loot in loot_import.new_loot.values())
+                        st.success(
+                            f"Loot log uploaded for {list_to_csv(list(loot_import.new_loot))}: "
+                            f"{new_entries} new entries, {loot_import.skipped} known entries skipped."
+                        )
+                    except ValueError as e:
+                        st.error(str(e))
 
 
 def build_loot_editor():
@@ -118,10 +150,11 @@ def build_loot_editor():
                 season = next((season for season in app.get_season_list() if season.name == selected_season))
             with col2:
                 raid_list = app.get_raid_list(season)
-                raid_day = st.selectbox("Select raid:", sorted([raid.date for raid in raid_list], reverse=True))
+                raid_day = st.selectbox("Select raid:", sorted([raid.date for raid in raid_list], reverse=True) + [WHOLE_SEASON])
 
             if season and raid_day:
-                loot_log_original = app.get_raid_loot(raid_day)
+                # fixes of the whole season are committed together, e.g. for renamed characters or traded items
+                loot_log_original = app.get_season_loot(season) if raid_day == WHOLE_SEASON else app.get_raid_loot(raid_day)
 
                 data = [loot.model_dump() for loot in loot_log_original]
                 columns = ["id", "character", "note", "response", "item_name", "boss", "difficulty", "instance", "timestamp"]
@@ -140,10 +173,12 @@ def build_loot_editor():
                         if not reason:
                             st.error("Please provide a reason for the fix.")
                         else:
-                            app.apply_fix_to_loot_log(transform(diff), raid_day, reason)
-                            st.success("Fix applied.")
-                            time.sleep(2)
-                            st.rerun()
+                            try:
+                                app.apply_fixes_to_loot_logs(transform(diff), season, reason)
+                                st.toast("Fix applied.")
+                                st.rerun()
+                            except ValueError as e:
+                                st.error(f"Validation failed! {str(e)}")
 
 
 def build_player_editor():
@@ -157,8 +192,7 @@ def build_player_editor():
                         st.error("Please enter a name for the new player.")
                     else:
                         app.add_player(new_player)
-                        st.success(f"Player added: {new_player}")
-                        time.sleep(2)
+                        st.toast(f"Player added: {new_player}")
                         st.rerun()
 
             with col2:
@@ -169,8 +203,7 @@ def build_player_editor():
                             st.error("Please select player to remove.")
                         else:
                             app.delete_player(player_name)
-                            st.success(f"Player removed: {player_name}")
-                            time.sleep(2)
+                            st.toast(f"Player removed: {player_name}")
                             st.rerun()
 
             data = [{"id": player.id, "name": player.name, "chars": ", ".join(player.chars)} for player in app.get_player_list()]
@@ -185,8 +218,7 @@ def build_player_editor():
 
                 if st.button("Submit changed player"):
                     app.update_player(transform(diff))
-                    st.success("Player updated.")
-                    time.sleep(2)
+                    st.toast("Player updated.")
                     st.rerun()
 
 
@@ -201,10 +233,12 @@ def build_raid_editor():
                     if not raid_date:
                         st.error("Please enter raid date.")
                     else:
-                        app.add_raid(str(raid_date))
-                        st.success(f"Raid added: {raid_date}")
-                        time.sleep(2)
-                        st.rerun()
+                        try:
+                            app.add_raid(str(raid_date))
+                            st.toast(f"Raid added: {raid_date}")
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
 
             with col2:
                 selected_raid_date = st.selectbox(
@@ -213,8 +247,7 @@ def build_raid_editor():
                 if st.checkbox("Really?", key="delete_raid_cb"):
                     if st.button("Delete raid") and selected_raid_date:
                         app.delete_raid(selected_raid_date)
-                        st.success(f"Raid deleted: {selected_raid_date}")
-                        time.sleep(2)
+                        st.toast(f"Raid deleted: {selected_raid_date}")
                         st.rerun()
 
             data = [
@@ -232,8 +265,7 @@ def build_raid_editor():
 
                 if st.button("Submit changed raid"):
                     app.update_raid(transform(diff))
-                    st.success("Raid updated.")
-                    time.sleep(2)
+                    st.toast("Raid updated.")
                     st.rerun()
 
             # player list from warcraftlogs.com
@@ -260,8 +292,7 @@ def build_season_editor():
                         st.error("Please enter new season name.")
                     else:
                         app.add_season(season_name)
-                        st.success(f"Season added: {season_name}")
-                        time.sleep(2)
+                        st.toast(f"Season added: {season_name}")
                         st.rerun()
 
             with right:
@@ -272,9 +303,20 @@ def build_season_editor():
                             st.error("Please select season to remove.")
                         else:
                             app.delete_season(selected_season)
-                            st.success(f"Season deleted: {selected_season}")
-                            time.sleep(2)
+                            st.toast(f"Season deleted: {selected_season}")
+                            st.rerun()
+
+                closed_season = st.selectbox("Archive closed season:", [season.desc for season in app.get_closed_season_list()], index=None)
+                if st.button("Archive season"):
+                    if not closed_season:
+                        st.error("Please select season to archive.")
+                    else:
+                        try:
+                            app.archive_season(closed_season)
+                            st.toast(f"Season archived: {closed_season}")
                             st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
 
             data = [
                 {"id": season.id, "name": season.name, "desc": season.desc, "start_date": season.start_date}
@@ -291,8 +333,7 @@ def build_season_editor():
 
                 if st.button("Submit changed season"):
                     app.update_season(transform(diff))
-                    st.success("Player updated.")
-                    time.sleep(2)
+                    st.toast("Player updated.")
                     st.rerun()
 
 
@@ -23,3 +23,6 @@ if st.button("Get debugging report"):
     code = "vF2C8crAdja1QKhD"
     app.get_example_report_debug(code)
 
+
+if st.button("Get statistics of current season"):
+    st.write([raid_stats.model_dump() for raid_stats in app.get_season_raid_stats(app.get_current_season())])
@@ -0,0 +1,144 @@
+"""
+Indexed SQLite mirror of the data files, alternative to the list based queries of the github client.
+"""
+
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+
+import json
+import logging
+import os
+import sqlite3
+from threading import Lock
+
+from core import Player, Raid, RawLoot, Season, to_model_list
+from storage import Snapshot
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS player (id INTEGER PRIMARY KEY, name TEXT NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS character (name TEXT NOT NULL, player_id INTEGER NOT NULL, position INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS character_name ON character (name);
+CREATE TABLE IF NOT EXISTS raid (id INTEGER PRIMARY KEY, date TEXT NOT NULL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS raid_date ON raid (date);
+CREATE TABLE IF NOT EXISTS season (id INTEGER PRIMARY KEY, name TEXT NOT NULL, start_date TEXT NOT NULL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS season_start_date ON season (start_date);
+CREATE TABLE IF NOT EXISTS loot (
+    id TEXT NOT NULL,
+    season_id INTEGER NOT NULL,
+    raid_date TEXT NOT NULL,
+    character TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS loot_season ON loot (season_id, raid_date);
+CREATE INDEX IF NOT EXISTS loot_character ON loot (character);
+"""
+
+
+class SqliteStore:
+    """Read-only mirror of a snapshot, rebuilt whenever the snapshot moves to another revision.
+
+    Usage: store.sync(database.snapshot) before querying, e.g. store.find_raid_by_date("2024-01-10").
+    Enabled by cache.sqlite of the config, the github client then answers its queries from it.
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        if db_path != ":memory:" and os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # shared between the threads of the streamlit sessions, access is serialized by the lock
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def sync(self, snapshot: Snapshot) -> bool:
+        """Mirrors the snapshot unless already done, returns whether the store was rebuilt."""
+        snapshot = snapshot.freeze()  # the files of a single revision, even if a commit moves the snapshot meanwhile
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+            if row and row[0] == snapshot.commit_sha:
+                return False
+            with self._connection:
+                self._rebuild(snapshot)
+            log.debug(f"Mirrored snapshot {snapshot.commit_sha}")
+            return True
+
+    def _rebuild(self, snapshot: Snapshot):
+        cursor = self._connection.cursor()
+        for table in ["meta", "player", "character", "raid", "season", "loot"]:
+            cursor.execute(f"DELETE FROM {table}")
+
+        player_list = to_model_list(Player, snapshot.get_bytes("data/player.json"))
+        cursor.executemany("INSERT INTO player VALUES (?, ?, ?)", [(p.id, p.name, p.model_dump_json()) for p in player_list])
+        cursor.executemany(
+            "INSERT INTO character VALUES (?, ?, ?)",
+            [(char, p.id, position) for position, p in enumerate(player_list) for char in p.chars],
+        )
+
+        raid_list = to_model_list(Raid, snapshot.get_bytes("data/raid.json"))
+        cursor.executemany("INSERT INTO raid VALUES (?, ?, ?)", [(r.id, r.date, r.model_dump_json()) for r in raid_list])
+
+        season_list = to_model_list(Season, snapshot.get_bytes("data/season.json"))
+        cursor.executemany(
+            "INSERT INTO season VALUES (?, ?, ?, ?)", [(s.id, s.name, s.start_date, s.model_dump_json()) for s in season_list]
+        )
+
+        for season in season_list:
+            for file_path in snapshot.list_dir(f"data/season/{season.name}"):
+                raid_date = file_path.split("/")[-1].split(".")[0]
+                cursor.executemany(
+                    "INSERT INTO loot VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            entry["id"],
+                            season.id,
+                            raid_date,
+                            entry["player"],
+                            json.dumps(entry, ensure_ascii=False),
+                        )
+                        for entry in json.loads(snapshot.get_content(file_path))
+                    ],
+                )
+
+        cursor.execute("INSERT INTO meta VALUES ('revision', ?)", (snapshot.commit_sha,))
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def find_raid_by_date(self, raid_day: str) -> Raid:
+        rows = self._query("SELECT data FROM raid WHERE date = ? ORDER BY id LIMIT 1", (raid_day,))
+        if not rows:
+            raise ValueError(f"No raid found for {raid_day}")
+        return Raid.model_validate_json(rows[0][0])
+
+    def find_player_by_character(self, char_name: str) -> Player:
+        rows = self._query(
+            "SELECT player.data FROM character JOIN player ON player.id = character.player_id"
+            " WHERE character.name = ? ORDER BY character.position LIMIT 1",
+            (char_name,),
+        )
+        if not rows:
+            raise ValueError(f"No player found having character {char_name}")
+        return Player.model_validate_json(rows[0][0])
+
+    def find_season_by_raid(self, raid: Raid) -> Season:
+        rows = self._query("SELECT data FROM season WHERE start_date <= ? ORDER BY start_date DESC LIMIT 1", (raid.date,))
+        if not rows:
+            raise ValueError(f"No season found for raid {raid.date}")
+        return Season.model_validate_json(rows[0][0])
+
+    def get_raid_list(self, season: Season) -> list[Raid]:
+        rows = self._query(
+            "SELECT data FROM raid WHERE date >= ?"
+            " AND date < coalesce((SELECT min(start_date) FROM season WHERE start_date > ?), '9999-12-31')"
+            " ORDER BY date, id",
+            (season.start_date, season.start_date),
+        )
+        return [Raid.model_validate_json(row[0]) for row in rows]
+
+    def get_season_loot_raw(self, season: Season) -> list[RawLoot]:
+        # latest raid first, entries in order of the loot log
+        rows = self._query("SELECT data FROM loot WHERE season_id = ? ORDER BY raid_date DESC, rowid", (season.id,))
+        return [RawLoot.model_validate_json(row[0]) for row in rows]
@@ -0,0 +1,177 @@
+"""
+Storage backends holding the data files, independent of the models built from them.
+"""
+
+# pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
+
+import hashlib
+import logging
+import os
+from collections.abc import Iterable
+from threading import get_ident
+
+log = logging.getLogger(__name__)
+
+DATA_DIR = "data/"
+EXAMPLE_DIR = "data/example/"  # api responses for development, not part of the database
+ARCHIVE_DIR = "data/archive/"  # final state of closed seasons, replaces their loot logs
+LOOT_LOG_DIR = "data/season/"
+
+
+class Snapshot:
+    """Content of the data directory at a single revision (commit) of the storage.
+
+    Updates replace the dicts instead of changing them, readers don't need a lock: a reference to content or blob_sha keeps
+    pointing to a complete revision, freeze() pins all of them at once.
+    """
+
+    def __init__(self, commit_sha: str, blob_sha: dict[str, str], content: dict[str, bytes]):
+        # file path -> git blob sha, file path -> file content
+        self._revision = (commit_sha, blob_sha, content)
+
+    @property
+    def commit_sha(self) -> str:
+        return self._revision[0]
+
+    @property
+    def blob_sha(self) -> dict[str, str]:
+        return self._revision[1]
+
+    @property
+    def content(self) -> dict[str, bytes]:
+        return self._revision[2]
+
+    def freeze(self) -> "Snapshot":
+        return Snapshot(*self._revision)
+
+    def list_dir(self, dir_path: str) -> list[str]:
+        prefix = dir_path.rstrip("/") + "/"
+        return sorted(path for path in self.content if path.startswith(prefix) and "/" not in path[len(prefix) :])
+
+    def get_content(self, file_path: str) -> str:
+        return self.get_bytes(file_path).decode("utf-8")
+
+    def get_bytes(self, file_path: str) -> bytes:
+        commit_sha, _, content = self._revision
+        if file_path not in content:
+            raise FileNotFoundError(f"File not found in snapshot {commit_sha}: {file_path}")
+        return content[file_path]
+
+    def update(self, changed: dict[str, tuple[bytes, str]], removed: list[str] = (), commit_sha: str | None = None):
+        """Moves to the next revision, changed maps the file path to its content and blob sha.
+
+        Without a commit sha, the revision is derived from the content of all files like for local files.
+        """
+        _, blob_sha, content = self._revision
+        blob_sha, content = dict(blob_sha), dict(content)
+        for file_path in removed:
+            blob_sha.pop(file_path, None)
+            content.pop(file_path, None)
+        for file_path, (file_content, file_blob_sha) in changed.items():
+            blob_sha[file_path] = file_blob_sha
+            content[file_path] = file_content
+        for file_path in get_archived_loot_logs(blob_sha):
+            blob_sha.pop(file_path)
+            content.pop(file_path)
+        self._revision = (commit_sha or _to_revision(blob_sha), blob_sha, content)
+
+
+class Storage:
+    """Interface of all storage backends, file paths are relative to the repository root (e.g. "data/raid.json")."""
+
+    def load(self) -> Snapshot:
+        """Reads all data files at the current revision."""
+        raise NotImplementedError
+
+    def refresh(self, snapshot: Snapshot) -> list[str] | None:
+        """Applies all changes since the revision of the snapshot to it and returns the paths of the changed files.
+
+        Returns None, if the snapshot can't be updated incrementally and needs to be loaded again.
+        """
+        raise NotImplementedError
+
+    def commit(self, snapshot: Snapshot, files: dict[str, str], commit_msg: str):
+        """Writes all files as a single change on top of the revision of the snapshot and updates the snapshot."""
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    """Data files inside a local directory having the layout of the repository, e.g. a clone of it."""
+
+    def __init__(self, root_dir: str):
+        self._root_dir = root_dir
+
+    def load(self) -> Snapshot:
+        content = self._read_data_dir()
+        blob_sha = {file_path: git_blob_sha(file_content) for file_path, file_content in content.items()}
+        log.debug(f"Loaded {len(content)} files from {self._root_dir}")
+        return Snapshot(_to_revision(blob_sha), blob_sha, content)
+
+    def refresh(self, snapshot: Snapshot) -> list[str] | None:
+        content = self._read_data_dir()
+        removed = [file_path for file_path in snapshot.content if file_path not in content]
+        changed = {}
+        for file_path, file_content in content.items():
+            blob_sha = git_blob_sha(file_content)
+            if snapshot.blob_sha.get(file_path) != blob_sha:
+                changed[file_path] = (file_content, blob_sha)
+        snapshot.update(changed, removed)
+        return sorted(removed + list(changed))
+
+    def commit(self, snapshot: Snapshot, files: dict[str, str], commit_msg: str):
+        changed = {}
+        for file_path, content in files.items():
+            data = content.encode("utf-8")
+            write_atomic(os.path.join(self._root_dir, file_path), data)
+            changed[file_path] = (data, git_blob_sha(data))
+        snapshot.update(changed)
+        log.info(f"{commit_msg}: {list(files)}")
+
+    def _read_data_dir(self) -> dict[str, bytes]:
+        file_list = []
+        for dir_path, _, file_names in os.walk(os.path.join(self._root_dir, DATA_DIR)):
+            for file_name in file_names:
+                file_path = os.path.relpath(os.path.join(dir_path, file_name), self._root_dir).replace(os.sep, "/")
+                if is_data_file(file_path) and not file_name.endswith(".tmp"):
+                    file_list.append(file_path)
+        result = {}
+        archived = get_archived_loot_logs(file_list)
+        for file_path in file_list:
+            if file_path not in archived:
+                with open(os.path.join(self._root_dir, file_path), "rb") as file:
+                    result[file_path] = file.read()
+        return result
+
+
+def _to_revision(blob_sha: dict[str, str]) -> str:
+    # local files have no commits, the revision is derived from the content of all files instead
+    return hashlib.sha1("\n".join(f"{path} {sha}" for path, sha in sorted(blob_sha.items())).encode("utf-8")).hexdigest()
+
+
+def is_data_file(file_path: str) -> bool:
+    return file_path.startswith(DATA_DIR) and not file_path.startswith(EXAMPLE_DIR)
+
+
+def get_archived_loot_logs(file_list: Iterable[str]) -> set[str]:
+    """Loot logs of archived seasons, they aren't part of a snapshot since the archive holds their content."""
+    file_list = list(file_list)
+    archived = {file_path[len(ARCHIVE_DIR) :].removesuffix(".json") for file_path in file_list if file_path.startswith(ARCHIVE_DIR)}
+    return {
+        file_path
+        for file_path in file_list
+        if file_path.startswith(LOOT_LOG_DIR) and file_path[len(LOOT_LOG_DIR) :].split("/")[0] in archived
+    }
+
+
+def write_atomic(file_path: str, content: bytes, mode: int = 0o666):
+    # concurrent readers never see a partially written file, the mode (minus umask) applies from its creation on
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}-{get_ident()}.tmp"
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode), "wb") as file:
+        file.write(content)
+    os.replace(tmp_path, file_path)
+
+
+def git_blob_sha(content: bytes) -> str:
+    """Calculates the hash git uses to address the content as blob."""
+    return hashlib.sha1(f"blob {len(content)}\0".encode("utf-8") + content).hexdigest()
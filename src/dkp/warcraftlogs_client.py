@@ -8,46 +8,209 @@ see request oauth doc: https://requests-oauthlib.readthedocs.io/en/latest/oauth2
 
 # pylint: disable=missing-module-docstring,missing-function-docstring,missing-class-docstring
 
+import asyncio
+import hashlib
 import json
 import logging
+import os
+import time
+from threading import Condition, Lock
 
 import requests
 from core import FightStats, RaidStats, list_to_csv
 from oauthlib.oauth2 import BackendApplicationClient
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session
+from storage import write_atomic
 
 from github_client import data_to_json
 
 log = logging.getLogger(__name__)
 
+MAX_CONNECTIONS = 4  # kept open to the api endpoint, reused by all queries
+TOKEN_REFRESH_MARGIN = 300  # seconds before the token expires a new one is fetched
+TIMEOUT = 10  # seconds
+FINISHED_REPORT_AGE = 24 * 60 * 60  # seconds after the end of a report it doesn't change anymore
+LIVE_REPORT_TTL = 60  # seconds responses of reports still being logged are reused
+REPORTS_PER_QUERY = 10  # reports fetched by a single request, keeps the query complexity within the api limit
+QUERY_COST = 1  # estimated rate limit points of a query, the api tells the actual points spent only on request
+REPORT_COST = 2  # estimated rate limit points per report queried
+RATE_LIMIT_HEADROOM = 300  # points of the hourly limit background work never spends, reserved for interactive requests
+RATE_LIMIT_SYNC_INTERVAL = 5 * 60  # seconds the estimated points spent are trusted before background work asks the api
+MAX_BACKGROUND_WAIT = 60  # seconds background work waits for points, longer waits fail and can be retried later
+RATE_LIMIT_FIELDS = """
+    rateLimitData {
+        limitPerHour
+        pointsSpentThisHour
+        pointsResetIn
+    }
+"""
+ATTENDANCE_FIELDS = """
+    endTime
+    fights(translate: true, killType: Encounters) {
+        size
+        friendlyPlayers
+    }
+    masterData(translate: true) {
+        actors(type: "Player") {
+            id
+            name
+            server
+        }
+    }
+"""
+
+
+class ResponseCache:
+    """Local store of query responses, by hash of the query and its variables."""
+
+    def __init__(self, cache_dir: str):
+        self._cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, query: str, variables: dict) -> dict | None:
+        file_path = self._response_path(query, variables)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] is not None and entry["expires_at"] < time.time():
+            return None
+        return entry["response"]
+
+    def put(self, query: str, variables: dict, response: dict, ttl: float | None):
+        """Stores the response for ttl seconds, None keeps it forever."""
+        entry = {"expires_at": None if ttl is None else time.time() + ttl, "response": response}
+        write_atomic(self._response_path(query, variables), json.dumps(entry).encode("utf-8"))
+
+    def _response_path(self, query: str, variables: dict) -> str:
+        key = hashlib.sha256(json.dumps([query, variables], sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self._cache_dir, key[:2], f"{key}.json")
+
+
+class RateLimiter:
+    """Points spent of the hourly rate limit, background work is delayed to keep headroom for interactive requests.
+
+    Interactive requests are never delayed, e.g. stopping the raid, the api rejects them when the limit is reached.
+    """
+
+    def __init__(self, headroom: int):
+        self._headroom = headroom
+        self._condition = Condition()
+        self._limit = None  # points per hour, None until the api told
+        self._spent = 0.0
+        self._reset_at = 0.0
+        self._synced_at = 0.0
+
+    def needs_sync(self) -> bool:
+        with self._condition:
+            return self._limit is None or time.time() - self._synced_at > RATE_LIMIT_SYNC_INTERVAL
+
+    def update(self, rate_limit_data: dict):
+        with self._condition:
+            self._limit = rate_limit_data["limitPerHour"]
+            self._spent = rate_limit_data["pointsSpentThisHour"]
+            self._reset_at = time.time() + rate_limit_data["pointsResetIn"]
+            self._synced_at = time.time()
+            self._condition.notify_all()
+
+    def exhausted(self):
+        with self._condition:
+            if self._limit is not None:
+                self._spent = self._limit
+
+    def acquire(self, cost: float, background: bool, max_wait: float | None = None):
+        """Counts the points of a request, waits for background requests until the points are available."""
+        deadline = time.time() + (MAX_BACKGROUND_WAIT if max_wait is None else max_wait)
+        with self._condition:
+            while background and self._limit is not None:
+                if time.time() >= self._reset_at:
+                    self._spent = 0.0
+                    self._reset_at = time.time() + 60 * 60
+                if self._spent + cost <= self._limit - self._headroom:
+                    break
+                if time.time() >= deadline:
+                    minutes = max(1, round((self._reset_at - time.time()) / 60))
+                    raise ValueError(f"Rate limit of warcraftlogs.com reserved for interactive requests, try again in {minutes} min.")
+                self._condition.wait(min(deadline, self._reset_at) - time.time())
+            self._spent += cost
+
 
 class WclClient:
-    def __init__(self, config, client_id, client_secret):
+    def __init__(self, config, client_id, client_secret, cache_dir: str = ""):
         self.client_id = client_id
         self.client_secret = client_secret
         self.token_uri = config.token_url
         self.api_endpoint = config.api_endpoint
+        self._token_file = os.path.join(cache_dir, "token.json") if cache_dir else ""
+        self._response_cache = ResponseCache(os.path.join(cache_dir, "responses")) if cache_dir else None
 
         self.client = OAuth2Session(client=BackendApplicationClient(client_id=self.client_id))
-        self._headers = None
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS))
+        self._token = None  # {"access_token": ..., "expires_at": ...}
+        self._token_lock = Lock()
+        self._rate_limiter = RateLimiter(RATE_LIMIT_HEADROOM)
 
     @property
     def headers(self):
-        if self._headers is None:
-            self._headers = self._get_headers()
-        return self._headers
-
-    def _get_headers(self):
+        return self._to_headers(self._get_token())
+
+    def _get_token(self, expired: dict | None = None) -> dict:
+        """Valid access token, fetched again shortly before it expires or when it was rejected (expired)."""
+        with self._token_lock:
+            if self._token is None:
+                self._token = self._load_token()
+            if self._token is None or self._token is expired or self._token["expires_at"] - TOKEN_REFRESH_MARGIN < time.time():
+                self._token = self._fetch_token()
+            return self._token
+
+    def _fetch_token(self) -> dict:
         token = self.client.fetch_token(token_url=self.token_uri, client_id=self.client_id, client_secret=self.client_secret)
-        return {
-            "Authorization": f"Bearer {token.get("access_token")}",
-            "Content-Type": "application/json",
-        }
+        # oauthlib adds expires_at to the token response, derived from expires_in
+        result = {"access_token": token["access_token"], "expires_at": token["expires_at"]}
+        if self._token_file:
+            # restarts reuse the token instead of fetching a new one
+            # readable by the owner only, a bearer token grants access to the api
+            write_atomic(self._token_file, json.dumps(result | {"client_id": self.client_id}).encode("utf-8"), mode=0o600)
+        return result
+
+    def _load_token(self) -> dict | None:
+        if not self._token_file or not os.path.exists(self._token_file):
+            return None
+        try:
+            with open(self._token_file, "r", encoding="utf-8") as file:
+                token = json.load(file)
+        except (OSError, ValueError):
+            log.warning(f"Ignoring unreadable token file {self._token_file}")
+            return None
+        if token.get("client_id") != self.client_id:
+            return None
+        return {"access_token": token["access_token"], "expires_at": token["expires_at"]}
 
     def get_data(self, query: str, **kwargs):
-        data = {"query": query, "variables": kwargs}
-        response = requests.get(self.api_endpoint, headers=self.headers, json=data, timeout=10)
+        return self._query(query, kwargs, QUERY_COST, background=False)
+
+    def _query(self, query: str, variables: dict, cost: float, background: bool):
+        if background and self._rate_limiter.needs_sync():
+            self._query(f"query {{ {RATE_LIMIT_FIELDS} }}", {}, QUERY_COST, background=False)
+        self._rate_limiter.acquire(cost, background)
+
+        data = {"query": query, "variables": variables}
+        token = self._get_token()
+        response = self._session.get(self.api_endpoint, headers=self._to_headers(token), json=data, timeout=TIMEOUT)
+        if response.status_code == 401:
+            # token revoked or expired earlier than announced
+            response = self._session.get(self.api_endpoint, headers=self._to_headers(self._get_token(token)), json=data, timeout=TIMEOUT)
+        if response.status_code == 429:
+            self._rate_limiter.exhausted()
+            raise ValueError("Rate limit of warcraftlogs.com reached, try again later.")
         response_json = response.json()
+        if (response_json.get("data") or {}).get("rateLimitData"):
+            self._rate_limiter.update(response_json["data"]["rateLimitData"])
 
         try:
             errors = response_json["errors"]
@@ -57,41 +220,58 @@ class WclClient:
 
         return response_json
 
-    def get_attending_character_list(self, report_id):
-        query = """query($code: String) {
-            reportData {
-                report(code: $code) {
-                    fights(translate: true, killType: Encounters) {
-                        size
-                        friendlyPlayers
-                    }
-                    masterData(translate: true) {
-                        actors(type: "Player") {
-                            id
-                            name
-                            server
-                        }
-                    }
-                }
-            }
+    def get_report_data(self, query: str, report_id: str, variables: dict | None = None, background: bool = False):
+        """Like get_data, reusing the response of finished reports. The query must select endTime of the report."""
+        variables = {"code": report_id} | (variables or {})
+        if self._response_cache is not None:
+            response_json = self._response_cache.get(query, variables)
+            if response_json is not None:
+                return response_json
+        response_json = self._query(query, variables, REPORT_COST, background)
+        if self._response_cache is not None:
+            self._response_cache.put(query, variables, response_json, _get_report_ttl(response_json))
+        return response_json
+
+    def _to_headers(self, token: dict) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {token["access_token"]}",
+            "Content-Type": "application/json",
         }
-        """
-        response_json = self.get_data(query, code=report_id)
 
-        all_fights = response_json["data"]["reportData"]["report"]["fights"]
+    def get_attending_character_list(self, report_id):
+        return self.get_attending_character_lists([report_id])[report_id]
 
-        char_id_list = []
-        for fight in all_fights:
-            char_id_list.extend(fight["friendlyPlayers"])
-        char_id_list = list(set(char_id_list))  # distinct
+    def get_attending_character_lists(self, report_ids: list[str], background: bool = False) -> dict[str, list[str]]:
+        """Characters attending the encounters of each report, fetched with as few requests as possible."""
+        reports = self.get_reports(ATTENDANCE_FIELDS, report_ids, background)
+        return {report_id: _to_character_list(report) for report_id, report in reports.items()}
 
-        all_chars = response_json["data"]["reportData"]["report"]["masterData"]["actors"]
-        char_list = []
-        for char in all_chars:
-            if char["id"] in char_id_list:
-                char_list.append(f"{char['name']}-{char['server']}")
+    def get_reports(self, fields: str, report_ids: list[str], background: bool = False) -> dict[str, dict]:
+        """Selects the fields of many reports, each request queries a chunk of reports using an alias per report.
 
-        return char_list
+        The responses are cached by report, same as get_report_data with a single report query. Fields must contain endTime.
+        Background work, e.g. a backfill, leaves headroom of the rate limit for interactive requests.
+        """
+        query = _to_report_query(fields)
+        result = {}
+        missing = []
+        for report_id in dict.fromkeys(report_ids):  # distinct, keeping the order
+            response_json = self._response_cache.get(query, {"code": report_id}) if self._response_cache is not None else None
+            if response_json is not None:
+                result[report_id] = response_json["data"]["reportData"]["report"]
+            else:
+                missing.append(report_id)
+
+        for i in range(0, len(missing), REPORTS_PER_QUERY):
+            chunk = missing[i : i + REPORTS_PER_QUERY]
+            variables = {f"code{n}": report_id for n, report_id in enumerate(chunk)}
+            response_json = self._query(_to_reports_query(fields, len(chunk)), variables, REPORT_COST * len(chunk), background)
+            for n, report_id in enumerate(chunk):
+                report_json = {"data": {"reportData": {"report": response_json["data"]["reportData"][f"report{n}"]}}}
+                if self._response_cache is not None:
+                    self._response_cache.put(query, {"code": report_id}, report_json, _get_report_ttl(report_json))
+                result[report_id] = report_json["data"]["reportData"]["report"]
+        return result
 
 
     def get_example_for_zones(self):
@@ -133,14 +313,7 @@ class WclClient:
 
 
     def get_example_for_rate_limits(self):
-        query = """query {
-            rateLimitData {
-                limitPerHour
-                pointsSpentThisHour
-                pointsResetIn
-            }
-        }
-        """
+        query = f"query {{ {RATE_LIMIT_FIELDS} }}"
         save_example_to_file("wcl-rate-limits", self.get_data(query))
 
 
@@ -151,6 +324,7 @@ class WclClient:
                     code
                     title
                     startTime
+                    endTime
                     fights(translate: true, killType: Encounters) {
                         id
                         size
@@ -174,7 +348,7 @@ class WclClient:
             }
         }
         """
-        save_example_to_file("wcl-report", self.get_data(query, code=report_id))
+        save_example_to_file("wcl-report", self.get_report_data(query, report_id))
 
 
     def get_example_for_player_details(self, report_id):
@@ -184,6 +358,7 @@ class WclClient:
                     code
                     title
                     startTime
+                    endTime
                     playerDetails(fightIDs: [4])
                     fights(translate: true, killType: Encounters) {
                         averageItemLevel
@@ -193,16 +368,20 @@ class WclClient:
             }
         }
         """
-        save_example_to_file("wcl-player_details", self.get_data(query, code=report_id))
+        save_example_to_file("wcl-player_details", self.get_report_data(query, report_id))
 
 
     def get_example_for_debugging_report(self, report_id):
+        save_example_to_file("statistics", self.get_raid_stats(report_id))
+
+    def get_raid_stats(self, report_id: str, background: bool = False) -> RaidStats:
         query = """query($code: String) {
             reportData {
                 report(code: $code) {
                     code
                     title
                     startTime
+                    endTime
                     fights(translate: true, killType: Encounters) {
                         id
                         size
@@ -226,28 +405,101 @@ class WclClient:
             }
         }
         """
+        response_json = self.get_report_data(query, report_id, background=background)
+        return _to_raid_stats(response_json["data"]["reportData"]["report"])
+
+    def get_fight_table(self, report_id: str, fight_id: int, background: bool = False) -> dict:
+        query = """query($code: String, $fight: Int) {
+            reportData {
+                report(code: $code) {
+                    endTime
+                    table(fightIDs: [$fight])
+                }
+            }
+        }
+        """
+        response_json = self.get_report_data(query, report_id, {"fight": fight_id}, background)
+        return response_json["data"]["reportData"]["report"]["table"]
+
+
+class AsyncWclClient:
+    """Runs the requests of a WclClient concurrently, e.g. the statistics of all reports of a season.
+
+    Each request is a blocking call of the client in a worker thread, sharing its connections, token, cache and rate limit.
+    """
+
+    def __init__(self, client: WclClient, max_concurrency: int = MAX_CONNECTIONS):
+        self._client = client
+        self._max_concurrency = max_concurrency
+
+    async def get_raid_stats_list(self, report_ids: list[str], background: bool = False) -> list[RaidStats]:
+        return await self._gather([(self._client.get_raid_stats, report_id, background) for report_id in report_ids])
+
+    async def get_fight_tables(self, report_id: str, fight_ids: list[int], background: bool = False) -> dict[int, dict]:
+        tables = await self._gather([(self._client.get_fight_table, report_id, fight_id, background) for fight_id in fight_ids])
+        return dict(zip(fight_ids, tables))
 
-        response_json = self.get_data(query, code=report_id)
+    async def _gather(self, calls: list[tuple]) -> list:
+        # created per call, a semaphore is bound to the event loop using it
+        semaphore = asyncio.Semaphore(self._max_concurrency)
 
-        report = response_json["data"]["reportData"]["report"]
-        fights = [fight for fight in report["fights"] if fight["size"] >= 9] # assuming raid size >= 9
+        async def run(func, *args):
+            async with semaphore:
+                return await asyncio.to_thread(func, *args)
 
-        result = RaidStats(
-            id=0,
-            report_id=report["code"],
-            name=report["title"],
-            fights=[FightStats(
+        return await asyncio.gather(*(run(*call) for call in calls))
+
+
+def _to_report_query(fields: str) -> str:
+    return f"query($code: String) {{ reportData {{ report(code: $code) {{ {fields} }} }} }}"
+
+
+def _to_reports_query(fields: str, count: int) -> str:
+    # aliases tell the reports apart, e.g. report0: report(code: $code0) { ... }
+    parameters = ", ".join(f"$code{n}: String" for n in range(count))
+    reports = " ".join(f"report{n}: report(code: $code{n}) {{ {fields} }}" for n in range(count))
+    # the points spent are returned along with the reports
+    return f"query({parameters}) {{ reportData {{ {reports} }} {RATE_LIMIT_FIELDS} }}"
+
+
+def _to_raid_stats(report: dict) -> RaidStats:
+    fights = [fight for fight in report["fights"] if fight["size"] >= 9]  # assuming raid size >= 9
+    return RaidStats(
+        id=0,
+        report_id=report["code"],
+        name=report["title"],
+        fights=[
+            FightStats(
                 id=fight["id"],
                 size=fight["size"],
                 boss_name=fight["name"],
                 item_level=fight["averageItemLevel"],
                 difficulty=str(fight["difficulty"]),
-                duration=fight["endTime"] - fight["startTime"]
-            ) for fight in fights]
-        )
-
-        save_example_to_file("statistics", result)
-
+                duration=fight["endTime"] - fight["startTime"],
+            )
+            for fight in fights
+        ],
+    )
+
+
+def _to_character_list(report: dict) -> list[str]:
+    char_id_list = []
+    for fight in report["fights"]:
+        char_id_list.extend(fight["friendlyPlayers"])
+    char_id_list = list(set(char_id_list))  # distinct
+
+    char_list = []
+    for char in report["masterData"]["actors"]:
+        if char["id"] in char_id_list:
+            char_list.append(f"{char['name']}-{char['server']}")
+    return char_list
+
+
+def _get_report_ttl(response_json: dict) -> float | None:
+    end_time = (response_json["data"]["reportData"]["report"] or {}).get("endTime")
+    if end_time is not None and time.time() - end_time / 1000 > FINISHED_REPORT_AGE:  # endTime in ms
+        return None
+    return LIVE_REPORT_TTL
 
 
 def save_example_to_file(file_name: str, content):
@@ -1,4 +1,18 @@
+import shutil
+
 from core import Balance, Fix, FixEntry, Loot, Player, Raid, RawLoot, Season
+from github_client import GithubClient
+from storage import LocalStorage
+
+
+def create_local_storage(tmp_path) -> LocalStorage:
+    # copy of the data files, changes don't touch the repository
+    shutil.copytree("data", tmp_path / "data", ignore=shutil.ignore_patterns("example"))
+    return LocalStorage(str(tmp_path))
+
+
+def create_test_database(tmp_path, **kwargs) -> GithubClient:
+    return GithubClient(storage=create_local_storage(tmp_path), **kwargs)
 
 
 def create_test_object_raw_loot(raw_loot: dict) -> RawLoot:
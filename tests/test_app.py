@@ -1,3 +1,6 @@
+import json
+
+import app
 import pytest
 from app import (
     ATTENDANCE_BONUS,
@@ -5,15 +8,17 @@ from app import (
     add_cost_to_balance_list,
     add_income_to_balance_list,
     apply_fixes,
+    apply_fixes_to_loot_logs,
+    check_loot_import,
     init_balance_list,
     merging_logs,
     validate_characters_known,
-    validate_expected_state,
     validate_note_values,
 )
 from core import Player
 
 from tests.commons import (
+    create_test_database,
     create_test_object_balance,
     create_test_object_fixes,
     create_test_object_raid,
@@ -90,43 +95,48 @@ def test_apply_fixes():
     assert apply_fixes(existing_log, fixes) == expected_result
 
 
-def test_validate_expected_state_empty_list():
-    with pytest.raises(ValueError, match="Empty list."):
-        validate_expected_state([])
-
-
-def test_validate_expected_state_duplicate_ids():
-    raw_loot_list = [
-        create_test_object_raw_loot({"date": "2022-01-01"}),
-        create_test_object_raw_loot({"date": "2022-01-01"}),
-    ]
-    with pytest.raises(ValueError, match="Duplicate id found."):
-        validate_expected_state(raw_loot_list)
-
-
-def test_validate_expected_state_different_dates():
-    raw_loot_list = [
-        create_test_object_raw_loot({"id": "1", "date": "2022-01-01"}),
-        create_test_object_raw_loot({"id": "2", "date": "2022-01-02"}),
-    ]
-    with pytest.raises(ValueError, match="Dates differ from each other."):
-        validate_expected_state(raw_loot_list)
-
-
-def test_validate_expected_state_succeeds():
-    raw_loot_list = [
-        create_test_object_raw_loot({"id": "1"}),
-        create_test_object_raw_loot({"id": "2"}),
-    ]
-    validate_expected_state(raw_loot_list)
-
-
-def test_validate_expected_state_response_gebot_empty_note():
-    raw_loot_list = [
-        create_test_object_raw_loot({"id": "1", "response": "Gebot", "note": ""}),
+def test_apply_fixes_to_loot_logs(tmp_path, mocker):
+    database = create_test_database(tmp_path)
+    mocker.patch.object(app, "DATABASE", database)
+    season = database.season_list[0]
+    first, second = database.get_raid_loot_raw("2023-11-15")[0], database.get_raid_loot_raw("2023-11-19")[0]
+    commit = mocker.spy(database, "commit_files")
+
+    # invalid fixes change nothing
+    with pytest.raises(ValueError, match="Unknown character"):
+        apply_fixes_to_loot_logs([create_test_object_fixes(first.id, {"character": "Unknown"})], season, "rename")
+    with pytest.raises(ValueError, match="No loot found"):
+        apply_fixes_to_loot_logs([create_test_object_fixes("unknown", {"note": "10"})], season, "rename")
+    assert database.get_raid_loot_raw("2023-11-15")[0].player == first.player
+    commit.assert_not_called()
+
+    fixes = [create_test_object_fixes(first.id, {"note": "10"}), create_test_object_fixes(second.id, {"note": "20"})]
+    apply_fixes_to_loot_logs(fixes, season, "clean up")
+    commit.assert_called_once()
+    assert sorted(commit.call_args.args[0]) == ["data/season/dfs3/2023-11-15.json", "data/season/dfs3/2023-11-19.json"]
+    assert commit.call_args.args[1] == "Fix: clean up"
+    assert next(loot for loot in database.get_raid_loot_raw("2023-11-15") if loot.id == first.id).note == "10"
+    assert next(loot for loot in database.get_raid_loot_raw("2023-11-19") if loot.id == second.id).note == "20"
+
+    database.archive_season(season, [])
+    with pytest.raises(ValueError, match="Season dfs3 is archived"):
+        apply_fixes_to_loot_logs(fixes, season, "clean up")
+
+
+def test_check_loot_import_archived_season(tmp_path, mocker):
+    database = create_test_database(tmp_path)
+    mocker.patch.object(app, "DATABASE", database)
+    existing = database.get_raid_loot_raw("2023-11-15")[0]
+    database.archive_season(database.season_list[0], [])
+    new = create_test_object_raw_loot({"id": "new", "player": existing.player, "date": existing.date})
+    content = json.dumps([loot.model_dump(by_alias=True) for loot in [existing, new]])
+
+    loot_import = check_loot_import(content)
+
+    assert loot_import.skipped == 1  # known from the archive
+    assert [(issue.row, issue.id, issue.message) for issue in loot_import.issues] == [
+        (2, "new", "Season dfs3 is archived, loot logs can't be changed anymore.")
     ]
-    with pytest.raises(ValueError, match='Respone is "Gebot" but empty note!'):
-        validate_expected_state(raw_loot_list)
 
 
 def test_init_balance_list():
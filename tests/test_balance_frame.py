@@ -0,0 +1,42 @@
+from app import compute_balance
+from balance_frame import compute_balance_list
+from core import BID_RESPONSE, Player, Raid
+
+from tests.commons import create_test_database, create_test_object_loot
+
+
+def test_compute_balance_list():
+    player_list = [
+        Player(id=1, name="Olli", chars=["Olli-A", "Olli-B"]),
+        Player(id=2, name="Carmen", chars=["Carmen-A"]),
+        Player(id=3, name="Alfons", chars=[]),
+    ]
+    raid_list = [
+        Raid(id=1, date="2024-01-01", report_id="", player=["Olli", "Carmen"]),
+        Raid(id=2, date="2024-01-02", report_id="", player=["Olli"]),
+    ]
+    loot_table = [
+        create_test_object_loot({"character": "Olli-A", "note": "10"}),
+        create_test_object_loot({"character": "Olli-B", "note": "20"}),
+        create_test_object_loot({"character": "Carmen-A", "note": "30"}),
+        create_test_object_loot({"character": "Unknown-A", "note": "40"}),
+    ]
+
+    result = compute_balance_list(player_list, raid_list, loot_table, 100, 50)
+
+    assert [(b.name, b.value, b.income, b.cost) for b in result] == [
+        ("Olli", 170, 200, -30),
+        ("Carmen", 120, 150, -30),
+        ("Alfons", 100, 100, 0),
+    ]
+    assert result == compute_balance(player_list, raid_list, loot_table)
+    assert compute_balance_list([], [], [], 100, 50) == []
+
+
+def test_compute_balance_list_same_as_loop(tmp_path):
+    database = create_test_database(tmp_path)
+    for season in database.season_list:
+        loot_table = [entry for entry in database.get_season_loot(season) if entry.response == BID_RESPONSE]
+        raid_list = database.get_raid_list(season)
+        expected = compute_balance(database.player_list, raid_list, loot_table)
+        assert compute_balance_list(database.player_list, raid_list, loot_table, 100, 50) == expected
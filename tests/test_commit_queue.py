@@ -0,0 +1,67 @@
+from threading import Event
+
+from commit_queue import CommitQueue
+
+
+def test_commit_in_background():
+    commits = []
+    started, release = Event(), Event()
+
+    def commit(files, commit_msg):
+        started.set()
+        release.wait(5)
+        commits.append((files, commit_msg))
+
+    queue = CommitQueue(commit)
+    queue.submit({"data/raid.json": "1"}, "Add raid")
+    assert started.wait(5)
+    # worker is busy, the following changes are coalesced into a single commit
+    queue.submit({"data/player.json": "1"}, "Update")
+    queue.submit({"data/player.json": "2"}, "Update")
+    assert queue.has_pending()
+    assert queue.status().pending_files == ["data/player.json", "data/raid.json"]
+
+    release.set()
+    assert queue.flush(5)
+    assert commits == [({"data/raid.json": "1"}, "Add raid"), ({"data/player.json": "2"}, "Update")]
+    assert not queue.has_pending()
+    assert queue.status().last_commit == "Update"
+
+
+def test_retry_failed_commit():
+    commits = []
+    failures = [RuntimeError("Conflict")]
+
+    def commit(files, commit_msg):
+        if failures:
+            raise failures.pop()
+        commits.append((files, commit_msg))
+
+    queue = CommitQueue(commit)
+    queue.submit({"data/raid.json": "1"}, "Add raid")
+    assert not queue.flush(5)  # paused after the failure
+    status = queue.status()
+    assert status.pending_files == ["data/raid.json"]
+    assert status.last_error == "Conflict"
+
+    queue.retry()
+    assert queue.flush(5)
+    assert commits == [({"data/raid.json": "1"}, "Add raid")]
+    assert queue.status().last_error == ""
+
+
+def test_discard_pending_changes():
+    def commit(files, commit_msg):
+        raise RuntimeError("Conflict")
+
+    queue = CommitQueue(commit)
+    queue.submit({"data/raid.json": "1", "data/player.json": "2"}, "Update")
+    assert not queue.flush(5)
+
+    assert queue.discard(["data/raid.json", "data/season.json"]) == ["data/raid.json"]
+    status = queue.status()
+    assert (status.pending_files, status.discarded_files, status.last_error) == (["data/player.json"], ["data/raid.json"], "Conflict")
+
+    assert queue.discard(["data/player.json"]) == ["data/player.json"]
+    assert not queue.has_pending()
+    assert queue.status().last_error == ""
@@ -1,5 +1,8 @@
+import json
+
 import pytest
-from core import Loot, to_date, to_raw_date
+from core import Loot, Player, RawLoot, to_date, to_model_list, to_raw_date, to_raw_loot_list
+from pydantic import ValidationError
 from tests.commons import create_test_object_loot
 
 
@@ -53,4 +56,16 @@ def test_validate_loot_succeeds():
         instance="instance",
         character="character",
         response="response",
-    )
\ No newline at end of file
+    )
+
+
+def test_to_model_list():
+    with open("data/season/dfs3/2023-11-15.json", "rb") as f:
+        content = f.read()
+    expected = [RawLoot(**entry) for entry in json.loads(content)]
+    assert to_raw_loot_list(content) == expected
+    assert to_raw_loot_list(content.decode("utf-8")) == expected
+
+    assert to_model_list(Player, b'[{"id": 1, "name": "Olli", "chars": []}]') == [Player(id=1, name="Olli", chars=[])]
+    with pytest.raises(ValidationError):
+        to_model_list(Player, b'[{"id": 1, "chars": []}]')
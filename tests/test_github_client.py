@@ -1,6 +1,14 @@
+import base64
+import io
+import tarfile
+
 import pytest
-from github_client import GithubClient
-from tests.commons import create_test_object_raid
+from core import Fix, FixEntry, to_raw_loot_list
+from github_client import GithubClient, to_raw_loot_json
+from ledger import BalanceLedger
+from storage import LocalStorage, Snapshot, git_blob_sha
+
+from tests.commons import create_test_database, create_test_object_raid
 
 def test_get_raid_by_date(mocker):
     expected_raid = create_test_object_raid({"date": "2024-01-01"})
@@ -15,4 +23,381 @@ def test_get_raid_by_date(mocker):
 
     # Test case for non-existing raid
     with pytest.raises(Exception, match="No raid found for 2099-12-31"):
-        cls.find_raid_by_date("2099-12-31")
\ No newline at end of file
+        cls.find_raid_by_date("2099-12-31")
+
+
+def create_fake_repo_api(mocker, file_list: list[str]):
+    content = {}
+    for file_path in file_list:
+        with open(file_path, "rb") as f:
+            content[file_path] = f.read()
+
+    def get_contents(path, ref):
+        result = []
+        for file_path in file_list:
+            if file_path.startswith(path + "/"):
+                child = path + "/" + file_path[len(path) + 1 :].split("/")[0]
+                if child == file_path:
+                    result.append(mocker.MagicMock(type="file", path=child, sha=git_blob_sha(content[file_path])))
+                elif child not in [entry.path for entry in result]:
+                    result.append(mocker.MagicMock(type="dir", path=child))
+        return result
+
+    repo_api = mocker.MagicMock()
+    repo_api.get_branch.return_value.commit.sha = "commit-sha"
+    repo_api.get_contents.side_effect = get_contents
+    repo_api.get_git_blob.side_effect = lambda sha: mocker.MagicMock(
+        content=base64.b64encode(next(c for c in content.values() if git_blob_sha(c) == sha))
+    )
+    return repo_api
+
+
+def test_load_raw_loot_list_file_by_file(mocker):
+    loot_files = ["data/season/dfs3/2023-11-15.json", "data/season/dfs3/2023-11-19.json"]
+    file_list = ["data/player.json", "data/raid.json", "data/season.json", "data/example/wcl-zones.json"] + loot_files
+
+    cls = GithubClient("no-branch", "no-token")
+    cls._storage._repo_api = create_fake_repo_api(mocker, file_list)
+
+    result = cls.raw_loot_list
+
+    dfs3, dfs4 = cls.season_list
+    raid_1, raid_2 = cls.find_raid_by_date("2023-11-15"), cls.find_raid_by_date("2023-11-19")
+    assert list(result.keys()) == [dfs3]  # no loot logs for dfs4
+    assert list(result[dfs3].keys()) == [raid_2, raid_1]  # latest first
+    with open("data/season/dfs3/2023-11-19.json", "r", encoding="utf-8") as f:
+        assert result[dfs3][raid_2] == to_raw_loot_list(f.read())
+    assert "data/example/wcl-zones.json" not in cls.snapshot.content
+    assert cls._storage.repo_api.get_git_blob.call_count == 5
+
+
+def create_fake_archive(file_list: list[str]) -> bytes:
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        tar.add("README.md", arcname="oliverfischer83-dkp-abc1234/README.md")
+        for file_path in file_list:
+            tar.add(file_path, arcname=f"oliverfischer83-dkp-abc1234/{file_path}")
+    return archive.getvalue()
+
+
+def test_load_snapshot(mocker):
+    file_list = ["data/player.json", "data/raid.json", "data/season.json", "data/season/dfs3/2023-11-15.json"]
+    repo_api = mocker.MagicMock()
+    repo_api.get_branch.return_value.commit.sha = "commit-sha"
+    repo_api.get_git_tree.return_value.tree = [mocker.MagicMock(path=path, sha=f"sha-{path}", type="blob") for path in file_list]
+    mocker.patch("github_client.requests.get").return_value.content = create_fake_archive(file_list)
+    mocker.patch("github_client.MAX_SINGLE_BLOBS", 0)  # download as tarball
+
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True)
+    cls._storage._repo_api = repo_api
+
+    assert cls.snapshot.commit_sha == "commit-sha"
+    assert sorted(cls.snapshot.content.keys()) == sorted(file_list)
+    assert cls.snapshot.list_dir("data/season/dfs3") == ["data/season/dfs3/2023-11-15.json"]
+    assert cls.find_player_by_name("Carmen").chars == ["Cheîra-Aman'thul"]
+    season = cls.season_list[0]
+    assert list(cls.raw_loot_list[season].keys()) == [cls.find_raid_by_date("2023-11-15")]
+    assert cls.snapshot.blob_sha["data/raid.json"] == "sha-data/raid.json"
+    repo_api.get_contents.assert_not_called()
+
+
+def test_git_blob_sha():
+    assert git_blob_sha(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+    assert git_blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_load_snapshot_from_blob_cache(mocker, tmp_path):
+    file_list = ["data/player.json", "data/raid.json", "data/season.json"]
+    content = {}
+    for file_path in file_list:
+        with open(file_path, "rb") as f:
+            content[file_path] = f.read()
+
+    def create_repo_api(branch_response):
+        repo_api = mocker.MagicMock()
+        repo_api.url = "https://api.github.com/repos/oliverfischer83/dkp"
+        repo_api._requester.requestJsonAndCheck.return_value = branch_response
+        repo_api.get_git_tree.return_value.tree = [
+            mocker.MagicMock(path=path, sha=git_blob_sha(content[path]), type="blob") for path in file_list
+        ]
+        repo_api.get_git_blob.side_effect = lambda sha: mocker.MagicMock(
+            content=base64.b64encode(next(c for c in content.values() if git_blob_sha(c) == sha))
+        )
+        return repo_api
+
+    # cold start, downloads everything
+    repo_api = create_repo_api(({"etag": '"etag-1"'}, {"commit": {"sha": "commit-sha"}}))
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True, cache_dir=str(tmp_path))
+    cls._storage._repo_api = repo_api
+    assert cls.snapshot.content == content
+    assert repo_api.get_git_blob.call_count == len(file_list)
+
+    # restart with unchanged branch, answered by "304 Not Modified"
+    repo_api = create_repo_api(({}, None))
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True, cache_dir=str(tmp_path))
+    cls._storage._repo_api = repo_api
+    assert cls.snapshot.commit_sha == "commit-sha"
+    assert cls.snapshot.content == content
+    _, kwargs = repo_api._requester.requestJsonAndCheck.call_args
+    assert kwargs["headers"] == {"If-None-Match": '"etag-1"'}
+    repo_api.get_git_tree.assert_not_called()
+    repo_api.get_git_blob.assert_not_called()
+
+
+def create_snapshot(commit_sha: str, file_list: list[str]) -> Snapshot:
+    content = {}
+    for file_path in file_list:
+        with open(file_path, "rb") as f:
+            content[file_path] = f.read()
+    return Snapshot(commit_sha, {path: git_blob_sha(c) for path, c in content.items()}, content)
+
+
+def test_refresh(mocker):
+    loot_file = "data/season/dfs3/2023-11-15.json"
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True)
+    cls._snapshot = create_snapshot("old-sha", ["data/player.json", "data/raid.json", "data/season.json", loot_file])
+    season = cls.season_list[0]
+    raid = cls.find_raid_by_date("2023-11-15")
+    assert len(cls.raw_loot_list[season][raid]) > 1
+
+    new_player = b'[{"id": 1, "name": "Carmen", "chars": ["Cheira-Aman\'thul"]}]'
+    new_loot = b"[]"
+    new_content = {git_blob_sha(new_player): new_player, git_blob_sha(new_loot): new_loot}
+    repo_api = mocker.MagicMock()
+    repo_api._requester.requestJsonAndCheck.return_value = ({}, {"commit": {"sha": "new-sha"}})
+    repo_api.get_branch.return_value.commit.sha = "new-sha"
+    repo_api.compare.return_value.status = "ahead"
+    repo_api.compare.return_value.files = [
+        mocker.MagicMock(filename="README.md", status="modified", sha="readme-sha"),
+        mocker.MagicMock(filename="data/player.json", status="modified", sha=git_blob_sha(new_player)),
+        mocker.MagicMock(filename=loot_file, status="modified", sha=git_blob_sha(new_loot)),
+    ]
+    repo_api.get_git_blob.side_effect = lambda sha: mocker.MagicMock(content=base64.b64encode(new_content[sha]))
+    cls._storage._repo_api = repo_api
+
+    assert cls.refresh() == ["data/player.json", loot_file]
+    assert cls.snapshot.commit_sha == "new-sha"
+    repo_api.compare.assert_called_once_with("old-sha", "new-sha")
+    assert cls.find_player_by_name("Carmen").chars == ["Cheira-Aman'thul"]
+    assert cls.raw_loot_list[season][raid] == []
+
+    # nothing changed since
+    repo_api.compare.reset_mock()
+    assert cls.refresh() == []
+    repo_api.compare.assert_not_called()
+
+
+def test_refresh_skips_unknown_loot_logs(tmp_path):
+    cls = create_test_database(tmp_path)
+    season = cls.season_list[0]
+    raid = cls.find_raid_by_date("2023-11-15")
+    assert cls.raw_loot_list[season][raid]
+
+    # loot logs without season or raid are skipped, later changes are still applied
+    for file_path in ["data/season/unknown/2023-11-15.json", "data/season/dfs3/2099-01-01.json", "data/season/dfs3/2023-11-15.json"]:
+        (tmp_path / file_path).parent.mkdir(exist_ok=True)
+        (tmp_path / file_path).write_text("[]")
+    assert cls.refresh() == ["data/season/dfs3/2023-11-15.json", "data/season/dfs3/2099-01-01.json", "data/season/unknown/2023-11-15.json"]
+    assert cls.raw_loot_list[season][raid] == []
+
+
+def test_batch_commit(mocker):
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True)
+    cls._snapshot = create_snapshot("old-sha", ["data/player.json", "data/raid.json", "data/season.json"])
+    repo_api = mocker.MagicMock()
+    repo_api.get_git_commit.return_value.sha = "old-sha"
+    repo_api.create_git_commit.return_value.sha = "new-sha"
+    cls._storage._repo_api = repo_api
+
+    with cls.batch_commit("Update"):
+        cls.add_raid("2099-01-01")
+        cls.create_raid_excel_file({"Olli": "100"})
+
+    repo_api.get_git_commit.assert_called_once_with("old-sha")
+    elements = repo_api.create_git_tree.call_args.args[0]
+    assert [e._identity["path"] for e in elements] == ["data/raid.json", "data/balance_fallback.csv"]
+    repo_api.create_git_commit.assert_called_once()
+    repo_api.get_git_ref.return_value.edit.assert_called_once_with("new-sha")
+    repo_api.update_file.assert_not_called()
+    assert cls.snapshot.commit_sha == "new-sha"
+    assert cls.snapshot.get_content("data/balance_fallback.csv") == "Olli,100"
+    assert cls.snapshot.blob_sha["data/balance_fallback.csv"] == git_blob_sha(b"Olli,100")
+
+    # single write outside of a batch, parent commit already known
+    cls.add_player("Alfons")
+    assert repo_api.create_git_commit.call_count == 2
+    repo_api.get_git_commit.assert_called_once()
+
+
+def test_batch_commit_failed(tmp_path, mocker):
+    cls = create_test_database(tmp_path)
+    raid_loot = cls.get_raid_loot_raw("2023-11-15")
+    commit = mocker.spy(cls, "commit_files")
+
+    with pytest.raises(RuntimeError):
+        with cls.batch_commit("Import"):
+            cls.update_loot_log([], "2023-11-15")
+            raise RuntimeError("failed")
+    commit.assert_not_called()
+    assert cls.get_raid_loot_raw("2023-11-15") == raid_loot
+    assert not cls._has_uncommitted_loot(cls.season_list[0])
+
+    # nested batch joins the outer one
+    with cls.batch_commit("Import"):
+        with cls.batch_commit("Fix"):
+            cls.update_loot_log([], "2023-11-15")
+        assert cls.get_raid_loot_raw("2023-11-15") == raid_loot  # applied with the commit
+        cls.update_loot_log([], "2023-11-19")
+    commit.assert_called_once()
+    assert sorted(commit.call_args.args[0]) == ["data/season/dfs3/2023-11-15.json", "data/season/dfs3/2023-11-19.json"]
+    assert commit.call_args.args[1] == "Import"
+    assert cls.get_raid_loot_raw("2023-11-15") == []
+
+
+def test_retry_commits_rejects_conflicts(tmp_path, mocker):
+    cls = create_test_database(tmp_path, write_behind=True)
+    raid_loot = cls.get_raid_loot_raw("2023-11-15")
+    commit = mocker.patch.object(cls._storage, "commit", side_effect=RuntimeError("Branch moved"))
+    cls.update_loot_log([], "2023-11-15")
+    cls.update_loot_log([], "2023-11-19")
+    assert not cls._commit_queue.flush(5)
+
+    # someone else changed one of the files in the meantime
+    (tmp_path / "data/season/dfs3/2023-11-15.json").write_text(to_raw_loot_json(raid_loot[:1]))
+    commit.side_effect = None
+    assert cls.retry_commits() == ["data/season/dfs3/2023-11-15.json"]
+    assert cls._commit_queue.flush(5)
+    assert list(commit.call_args.args[1]) == ["data/season/dfs3/2023-11-19.json"]
+    assert cls.get_commit_status().discarded_files == ["data/season/dfs3/2023-11-15.json"]
+    assert cls.get_raid_loot_raw("2023-11-15") == raid_loot[:1]
+
+
+def test_lookup_indexes_follow_changes(mocker):
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True)
+    cls._snapshot = create_snapshot("old-sha", ["data/player.json", "data/raid.json", "data/season.json"])
+    cls._storage._repo_api = mocker.MagicMock()
+
+    player = cls.find_player_by_name("Carmen")
+    assert cls.find_player_by_character("Cheîra-Aman'thul") == player
+    assert cls.find_player_by_id(player.id) == player
+
+    cls.update_player([Fix(id=str(player.id), entries=[FixEntry(name="chars", value="Newchar-Aman'thul")])])
+    assert cls.find_player_by_character("Newchar-Aman'thul") == player
+    with pytest.raises(ValueError, match="No player found having character"):
+        cls.find_player_by_character("Cheîra-Aman'thul")
+
+    cls.add_raid("2099-01-01")
+    raid = cls.find_raid_by_date("2099-01-01")
+    assert cls.find_raid_by_id(raid.id) == raid
+    cls.delete_raid("2099-01-01")
+    with pytest.raises(ValueError, match="No raid found for 2099-01-01"):
+        cls.find_raid_by_date("2099-01-01")
+
+    season = cls.season_list[0]
+    assert cls.find_season_by_id(season.id) == season
+
+
+def test_season_intervals():
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True)
+    cls._snapshot = create_snapshot("old-sha", ["data/player.json", "data/raid.json", "data/season.json"])
+
+    seasons = sorted(cls.season_list, key=lambda season: season.start_date)
+    for i, season in enumerate(seasons):
+        season_end = seasons[i + 1].start_date if i + 1 < len(seasons) else "9999-12-31"
+        expected = [raid for raid in cls.raid_list if season.start_date <= raid.date < season_end]
+        assert cls.get_raid_list(season) == expected
+        for raid in expected:
+            assert cls.find_season_by_raid(raid) == season
+
+    with pytest.raises(ValueError, match="No season found for raid 2000-01-01"):
+        cls.find_season_by_raid(create_test_object_raid({"date": "2000-01-01"}))
+
+
+def test_clean_loot_cache(mocker):
+    loot_files = ["data/season/dfs3/2023-11-15.json", "data/season/dfs3/2023-11-19.json"]
+    cls = GithubClient("no-branch", "no-token", bulk_sync=True)
+    cls._snapshot = create_snapshot("old-sha", ["data/player.json", "data/raid.json", "data/season.json"] + loot_files)
+    cls._storage._repo_api = mocker.MagicMock()
+    season = cls.season_list[0]
+    cleaning = mocker.spy(cls, "_cleaning")
+
+    expected = GithubClient._cleaning(cls, cls.get_season_loot_raw(season))
+    assert cls.get_season_loot(season) == expected
+    assert cls.get_season_loot(season) == expected
+    assert cleaning.call_count == 2  # once per raid
+
+    # loot log changed in place and written
+    raid_loot = cls.get_raid_loot_raw("2023-11-15")
+    raid_loot[0].note = "990"
+    cls.fix_loot_log(raid_loot, "2023-11-15", "test")
+    assert raid_loot[0].id in [entry.id for entry in cls.get_raid_loot("2023-11-15") if entry.note == "990"]
+    assert cleaning.call_count == 3
+
+    # players changed
+    cls.add_player("Alfons")
+    cls.get_season_loot(season)
+    assert cleaning.call_count == 5
+
+
+def test_archive_season(tmp_path):
+    cls = create_test_database(tmp_path)
+    dfs3, dfs4 = cls.season_list
+    season_loot = cls.get_season_loot(dfs3)
+    raid_loot = cls.get_raid_loot("2023-11-15")
+    empty_raids = cls.get_empty_raid_list(dfs3)
+    balance = BalanceLedger(cls, 100, 50).get_balance(dfs3)
+
+    with pytest.raises(ValueError, match="Season dfs4 is not closed yet."):
+        cls.archive_season(dfs4, [])
+    cls.archive_season(dfs3, balance)
+    assert "data/archive/dfs3.json" in cls.snapshot.content
+    assert cls.snapshot.list_dir("data/season/dfs3") == []
+
+    # restart, archived loot logs aren't loaded anymore
+    cls = GithubClient(storage=LocalStorage(str(tmp_path)))
+    assert cls.snapshot.list_dir("data/season/dfs3") == []
+    assert (tmp_path / "data/season/dfs3/2023-11-15.json").exists()
+    assert dfs3 not in cls.raw_loot_list
+    assert dfs3 not in cls.get_empty_season_list()
+    assert cls.is_archived(dfs3)
+    assert cls.get_season_loot(dfs3) == season_loot
+    assert cls.get_raid_loot("2023-11-15") == raid_loot
+    assert cls.get_empty_raid_list(dfs3) == empty_raids
+    assert cls.get_archive(dfs3).balance == balance
+    assert BalanceLedger(cls, 100, 50).get_balance(dfs3) == balance
+    with pytest.raises(ValueError, match="Season dfs3 is archived"):
+        cls.update_loot_log([], "2023-11-15")
+
+    # raids are served from the archive and can't be changed anymore
+    raid = cls.find_raid_by_date("2023-11-15")
+    assert cls.get_raid_list(dfs3) == cls.get_archive(dfs3).raids
+    for change in [
+        lambda: cls.update_raid([Fix(id=str(raid.id), entries=[FixEntry(name="player", value="Olli")])]),
+        lambda: cls.update_raid([Fix(id=str(cls.raid_list[-1].id), entries=[FixEntry(name="date", value="2023-11-16")])]),
+        lambda: cls.delete_raid("2023-11-15"),
+        lambda: cls.add_raid("2023-11-16"),
+    ]:
+        with pytest.raises(ValueError, match="Season dfs3 is archived"):
+            change()
+    ledger = BalanceLedger(cls, 100, 50)
+    assert ledger.get_balance(dfs3, as_of=ledger.get_dates(dfs3)[-1]) == balance
+
+
+def test_season_loot_eviction(tmp_path, mocker):
+    cls = create_test_database(tmp_path, max_loot_seasons=1)
+    dfs3, dfs4 = cls.season_list
+    raid_loot = cls.get_raid_loot_raw("2023-11-15")
+    assert list(cls._season_loot) == [dfs3.id]  # only the requested season
+
+    cls.add_raid("2024-05-01")
+    cls.create_loot_log(raid_loot, "2024-05-01")
+    assert list(cls._season_loot) == [dfs4.id]  # least recently used season evicted
+    assert cls.get_raid_loot_raw("2023-11-15") == raid_loot  # loaded again
+    assert list(cls._season_loot) == [dfs3.id]
+
+    # changes not committed yet are kept in memory
+    mocker.patch.object(cls._storage, "commit")
+    cls.update_loot_log(raid_loot[:1], "2023-11-15")
+    assert {entry.id for entry in cls.get_raid_loot_raw("2024-05-01")} == {entry.id for entry in raid_loot}  # stored sorted
+    assert list(cls._season_loot) == [dfs3.id, dfs4.id]
+    assert cls.get_raid_loot_raw("2023-11-15") == raid_loot[:1]
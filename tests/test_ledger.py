@@ -0,0 +1,66 @@
+from app import compute_balance
+from core import BID_RESPONSE, Fix, FixEntry
+from github_client import GithubClient
+from ledger import BalanceLedger
+
+from tests.commons import create_test_database
+
+
+def compute_season_balance(database: GithubClient, season):
+    loot = [entry for entry in database.get_season_loot(season) if entry.response == BID_RESPONSE]
+    return compute_balance(database.player_list, database.get_raid_list(season), loot)
+
+
+def test_ledger_follows_changes(tmp_path, mocker):
+    database = create_test_database(tmp_path)
+    ledger = BalanceLedger(database, 100, 50)
+    season = database.season_list[0]
+    assert ledger.get_balance(season) == compute_season_balance(database, season)
+
+    # unchanged raids are not applied again
+    get_clean_loot = mocker.spy(database, "get_clean_loot")
+    assert ledger.get_balance(season) == compute_season_balance(database, season)
+    get_clean_loot.assert_not_called()
+
+    # attendees changed
+    raid = database.find_raid_by_date("2023-11-15")
+    database.update_raid([Fix(id=str(raid.id), entries=[FixEntry(name="player", value=raid.player[0])])])
+    assert ledger.get_balance(season) == compute_season_balance(database, season)
+
+    # loot log fixed
+    raid_loot = database.get_raid_loot_raw("2023-11-19")
+    entry = next(entry for entry in raid_loot if entry.response == BID_RESPONSE)
+    entry.note = str(int(entry.note) + 100)
+    database.fix_loot_log(raid_loot, "2023-11-19", "test")
+    assert ledger.get_balance(season) == compute_season_balance(database, season)
+    get_clean_loot.assert_called_once_with(season, database.find_raid_by_date("2023-11-19"))
+
+    # raid removed
+    database.delete_raid("2023-11-15")
+    ledger.rebuild()
+    assert ledger.get_balance(season) == compute_season_balance(database, season)
+
+
+def test_balance_as_of_date(tmp_path):
+    database = create_test_database(tmp_path)
+    ledger = BalanceLedger(database, 100, 50)
+    season = database.season_list[0]
+    player = database.player_list[0]
+
+    dates = ledger.get_dates(season)
+    assert dates == sorted(set(dates)) and len(dates) > 1
+    for date in dates:
+        raid_list = [raid for raid in database.get_raid_list(season) if raid.date <= date]
+        loot = [
+            entry
+            for raid in database.raw_loot_list[season]
+            if raid.date <= date
+            for entry in database.get_clean_loot(season, raid)
+            if entry.response == BID_RESPONSE
+        ]
+        expected = compute_balance(database.player_list, raid_list, loot)
+        assert ledger.get_balance(season, as_of=date) == expected
+        assert ledger.get_balance_history(season, player)[date] == expected[0]
+
+    assert ledger.get_balance(season, as_of=dates[-1]) == ledger.get_balance(season)
+    assert [balance.value for balance in ledger.get_balance(season, as_of="2000-01-01")] == [100] * len(database.player_list)
@@ -0,0 +1,82 @@
+import json
+
+from core import BID_RESPONSE
+from loot_import import check_loot_export
+
+from tests.commons import create_test_object_raw_loot
+
+
+def to_export(*entries: dict) -> str:
+    raw_loot_list = [create_test_object_raw_loot({"player": "Moppi", "date": "31/1/24"} | entry) for entry in entries]
+    return json.dumps([raw_loot.model_dump(by_alias=True) for raw_loot in raw_loot_list])
+
+
+def test_check_loot_export_succeeds():
+    content = to_export({"id": "1", "response": BID_RESPONSE, "note": "20"}, {"id": "2", "response": "Bedarf"})
+    result = check_loot_export(content, lambda raid_day: set(), {"Moppi"})
+    assert result.issues == []
+    assert {raid_day: [loot.id for loot in new_loot] for raid_day, new_loot in result.new_loot.items()} == {"2024-01-31": ["1", "2"]}
+
+
+def test_check_loot_export_skips_existing_entries():
+    # existing entries were cleaned up before, they are not checked again
+    content = to_export({"id": "1", "player": "Unknown", "note": "5"}, {"id": "2"})
+    result = check_loot_export(content, lambda raid_day: {"1"} if raid_day == "2024-01-31" else set(), {"Moppi"})
+    assert result.issues == []
+    assert result.skipped == 1
+    assert [loot.id for loot in result.new_loot["2024-01-31"]] == ["2"]
+
+
+def test_check_loot_export_reports_all_issues():
+    content = to_export(
+        {"id": "1", "player": "Unknown"},
+        {"id": "1", "note": "15"},
+        {"id": "2", "note": "abc"},
+        {"id": "3", "response": BID_RESPONSE},
+    )
+    result = check_loot_export(content, lambda raid_day: set(), {"Moppi"})
+    assert [(issue.row, issue.id) for issue in result.issues] == [(1, "1"), (2, "1"), (2, "1"), (3, "2"), (4, "3")]
+    assert "Unknown character" in result.issues[0].message
+    assert "Duplicate id found" in result.issues[1].message
+    assert "steps of 10" in result.issues[2].message
+    assert "parsable integer" in result.issues[3].message
+    assert "empty note" in result.issues[4].message
+
+
+def test_check_loot_export_several_raid_days():
+    content = to_export({"id": "1", "date": "7/2/24"}, {"id": "2"}, {"id": "3", "date": "7/2/24"}, {"id": "4", "date": "14/2/24"})
+    existing_ids = {"2024-01-31": {"2"}, "2024-02-07": set()}
+
+    def get_existing_ids(raid_day: str) -> set[str]:
+        if raid_day not in existing_ids:
+            raise ValueError(f"No raid found for {raid_day}")
+        return existing_ids[raid_day]
+
+    result = check_loot_export(content, get_existing_ids, {"Moppi"})
+    assert [(issue.row, issue.id, issue.message) for issue in result.issues] == [(4, "4", "No raid found for 2024-02-14")]
+    assert result.skipped == 1
+    assert {raid_day: [loot.id for loot in new_loot] for raid_day, new_loot in result.new_loot.items()} == {"2024-02-07": ["1", "3"]}
+
+
+def test_check_loot_export_invalid_content():
+    assert check_loot_export("[{", lambda raid_day: set(), set()).issues[0].message.startswith("Invalid JSON")
+    assert "Empty list" in check_loot_export("[]", lambda raid_day: set(), set()).issues[0].message
+    result = check_loot_export('[{"id": "1"}]', lambda raid_day: set(), set())
+    assert (result.issues[0].row, result.issues[0].id) == (1, "1")
+    assert "player: Field required" in result.issues[0].message
+
+
+def test_check_loot_export_nothing_new():
+    result = check_loot_export(to_export({"id": "1"}), lambda raid_day: {"1"}, {"Moppi"})
+    assert result.skipped == 1
+    assert "Empty list" in result.issues[0].message
+
+
+def test_check_loot_export_locked_raid_day():
+    content = to_export({"id": "1"}, {"id": "2"}, {"id": "3", "date": "7/2/24"})
+    result = check_loot_export(
+        content, lambda raid_day: {"1"}, {"Moppi"}, lambda raid_day: "Season archived" if raid_day == "2024-01-31" else None
+    )
+    assert [(issue.row, issue.id, issue.message) for issue in result.issues] == [(2, "2", "Season archived")]
+    assert result.skipped == 1
+    assert list(result.new_loot) == ["2024-02-07"]
@@ -0,0 +1,59 @@
+import pytest
+from github_client import GithubClient
+from pydantic import BaseModel
+from sqlite_store import SqliteStore
+from storage import LocalStorage
+
+from tests.commons import create_test_database
+
+
+@pytest.fixture(name="database")
+def fixture_database() -> GithubClient:
+    return GithubClient(storage=LocalStorage("."))
+
+
+def to_dump(model_list: list[BaseModel]) -> list[dict]:
+    # models like Raid and Player compare their ids only
+    return [model.model_dump() for model in model_list]
+
+
+def test_queries_match_github_client(database):
+    store = SqliteStore()
+    assert store.sync(database.snapshot)
+    assert not store.sync(database.snapshot)  # same revision
+
+    for season in database.season_list:
+        assert to_dump(store.get_raid_list(season)) == to_dump(database.get_raid_list(season))
+        assert to_dump(store.get_season_loot_raw(season)) == to_dump(database.get_season_loot_raw(season))
+    for raid in database.raid_list:
+        assert store.find_raid_by_date(raid.date).model_dump() == raid.model_dump()
+        assert store.find_season_by_raid(raid).model_dump() == database.find_season_by_raid(raid).model_dump()
+    for player in database.player_list:
+        for char in player.chars:
+            assert store.find_player_by_character(char).model_dump() == database.find_player_by_character(char).model_dump()
+
+
+def test_queries_fail_for_unknown(database):
+    store = SqliteStore()
+    store.sync(database.snapshot)
+
+    with pytest.raises(ValueError, match="No raid found for 2099-12-31"):
+        store.find_raid_by_date("2099-12-31")
+    with pytest.raises(ValueError, match="No player found having character Unknown"):
+        store.find_player_by_character("Unknown")
+
+
+def test_github_client_queries_sqlite(tmp_path):
+    models = create_test_database(tmp_path / "models")
+    database = create_test_database(tmp_path / "sqlite", sqlite_path=str(tmp_path / "cache" / "dkp.sqlite"))
+    for season in database.season_list:
+        assert to_dump(database.get_raid_list(season)) == to_dump(models.get_raid_list(season))
+        assert to_dump(database.get_season_loot_raw(season)) == to_dump(models.get_season_loot_raw(season))
+    assert database.find_raid_by_date("2023-11-15").model_dump() == models.find_raid_by_date("2023-11-15").model_dump()
+
+    # mirror follows the committed changes, pending changes of a batch are answered from the models
+    with database.batch_commit("Update"):
+        database.add_raid("2024-12-31")
+        assert database.find_raid_by_date("2024-12-31").date == "2024-12-31"
+    assert database._get_sqlite() is not None
+    assert database.find_raid_by_date("2024-12-31").date == "2024-12-31"
@@ -0,0 +1,55 @@
+import os
+
+from github_client import GithubClient
+from storage import get_archived_loot_logs, git_blob_sha
+
+from tests.commons import create_local_storage
+
+
+def test_local_storage_load(tmp_path):
+    storage = create_local_storage(tmp_path)
+
+    snapshot = storage.load()
+
+    assert "data/raid.json" in snapshot.content
+    assert "data/season/dfs3/2024-04-12.json" in snapshot.list_dir("data/season/dfs3")
+    assert snapshot.blob_sha["data/raid.json"] == git_blob_sha(snapshot.content["data/raid.json"])
+    assert storage.load().commit_sha == snapshot.commit_sha  # unchanged files, same revision
+
+
+def test_local_storage_commit_and_refresh(tmp_path):
+    storage = create_local_storage(tmp_path)
+    cls = GithubClient(storage=storage)
+    revision = cls.snapshot.commit_sha
+
+    cls.add_player("Alfons")
+
+    assert cls.snapshot.commit_sha != revision
+    assert GithubClient(storage=storage).find_player_by_name("Alfons").chars == []
+    assert cls.refresh() == []  # own changes are known already
+
+    # changes by someone else
+    os.remove(tmp_path / "data/season/dfs3/2024-04-12.json")
+    assert cls.refresh() == ["data/season/dfs3/2024-04-12.json"]
+    assert cls.get_raid_loot_raw("2024-04-12") == []
+
+
+def test_snapshot_update_keeps_readers_consistent(tmp_path):
+    storage = create_local_storage(tmp_path)
+    snapshot = storage.load()
+    frozen = snapshot.freeze()
+    file_iter = iter(snapshot.content)
+    next(file_iter)
+
+    storage.commit(snapshot, {"data/season/dfs3/2099-01-01.json": "[]"}, "Add loot log")
+
+    list(file_iter)  # iterating the previous revision doesn't fail
+    assert "data/season/dfs3/2099-01-01.json" in snapshot.list_dir("data/season/dfs3")
+    assert "data/season/dfs3/2099-01-01.json" not in frozen.list_dir("data/season/dfs3")
+    assert frozen.commit_sha != snapshot.commit_sha
+
+
+def test_archived_loot_logs():
+    file_list = ["data/archive/dfs3.json", "data/season/dfs3/2023-11-15.json", "data/season/dfs4/2024-04-24.json", "data/raid.json"]
+    assert get_archived_loot_logs(file_list) == {"data/season/dfs3/2023-11-15.json"}
+    assert get_archived_loot_logs(file_list[1:]) == set()
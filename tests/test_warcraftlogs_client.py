@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+import warcraftlogs_client
+from config_mapper import WclClient as WclConfig
+from core import RaidStats
+from warcraftlogs_client import AsyncWclClient, WclClient
+
+CONFIG = WclConfig(client_id="", client_secret="", token_url="https://wcl/token", api_endpoint="https://wcl/api")
+
+
+def create_client(mocker, tmp_path, expires_in=3600) -> WclClient:
+    client = WclClient(CONFIG, "id", "secret", cache_dir=str(tmp_path))
+    tokens = iter(range(1, 100))
+    mocker.patch.object(
+        client.client,
+        "fetch_token",
+        side_effect=lambda **kwargs: {"access_token": f"token{next(tokens)}", "expires_at": time.time() + expires_in},
+    )
+    return client
+
+
+def mock_response(mocker, client: WclClient, *status_codes: int, data=None):
+    responses = [mocker.MagicMock(status_code=status_code, json=lambda: {"data": data or {}}) for status_code in status_codes]
+    return mocker.patch.object(client._session, "get", side_effect=responses)
+
+
+def test_token_reused(mocker, tmp_path):
+    client = create_client(mocker, tmp_path)
+    get = mock_response(mocker, client, 200, 200)
+    client.get_data("query")
+    client.get_data("query")
+    assert client.client.fetch_token.call_count == 1
+    assert get.call_args.kwargs["headers"]["Authorization"] == "Bearer token1"
+    assert os.stat(client._token_file).st_mode & 0o777 == 0o600
+
+    # restarted process reads the token from disk
+    restarted = create_client(mocker, tmp_path)
+    get = mock_response(mocker, restarted, 200)
+    restarted.get_data("query")
+    restarted.client.fetch_token.assert_not_called()
+    assert get.call_args.kwargs["headers"]["Authorization"] == "Bearer token1"
+
+
+def test_token_refreshed_before_expiry(mocker, tmp_path):
+    client = create_client(mocker, tmp_path, expires_in=60)  # within the refresh margin
+    mock_response(mocker, client, 200, 200)
+    client.get_data("query")
+    client.get_data("query")
+    assert client.client.fetch_token.call_count == 2
+
+
+def test_token_refreshed_when_rejected(mocker, tmp_path):
+    client = create_client(mocker, tmp_path)
+    get = mock_response(mocker, client, 401, 200)
+    assert client.get_data("query") == {"data": {}}
+    assert [call.kwargs["headers"]["Authorization"] for call in get.call_args_list] == ["Bearer token1", "Bearer token2"]
+
+
+def test_finished_report_cached(mocker, tmp_path):
+    client = create_client(mocker, tmp_path)
+    report = {"reportData": {"report": {"endTime": (time.time() - 2 * 24 * 60 * 60) * 1000}}}
+    get = mock_response(mocker, client, 200, data=report)
+    assert client.get_report_data("query", "abc") == {"data": report}
+    assert create_client(mocker, tmp_path).get_report_data("query", "abc") == {"data": report}
+    assert get.call_count == 1
+
+
+def test_live_report_expires(mocker, tmp_path):
+    mocker.patch.object(warcraftlogs_client, "LIVE_REPORT_TTL", -1)
+    client = create_client(mocker, tmp_path)
+    report = {"reportData": {"report": {"endTime": time.time() * 1000}}}
+    get = mock_response(mocker, client, 200, 200, data=report)
+    client.get_report_data("query", "abc")
+    client.get_report_data("query", "abc")
+    assert get.call_count == 2
+
+
+def test_attending_characters_of_many_reports(mocker, tmp_path):
+    mocker.patch.object(warcraftlogs_client, "REPORTS_PER_QUERY", 2)
+    client = create_client(mocker, tmp_path)
+
+    def to_report(name: str) -> dict:
+        actors = [{"id": 1, "name": name, "server": "Blackhand"}, {"id": 2, "name": "Benched", "server": "Blackhand"}]
+        return {"endTime": 0, "fights": [{"size": 20, "friendlyPlayers": [1]}], "masterData": {"actors": actors}}
+
+    responses = [
+        {"data": {"reportData": {"report0": to_report("Moppi"), "report1": to_report("Zelma")}}},
+        {"data": {"reportData": {"report0": to_report("Wurzel")}}},
+    ]
+    get = mocker.patch.object(
+        client._session, "get", side_effect=[mocker.MagicMock(status_code=200, json=lambda r=r: r) for r in responses]
+    )
+    expected = {"a": ["Moppi-Blackhand"], "b": ["Zelma-Blackhand"], "c": ["Wurzel-Blackhand"]}
+    assert client.get_attending_character_lists(["a", "b", "c", "a"]) == expected
+    assert get.call_count == 2
+    assert get.call_args_list[0].kwargs["json"]["variables"] == {"code0": "a", "code1": "b"}
+    assert "report1: report(code: $code1)" in get.call_args_list[0].kwargs["json"]["query"]
+
+    # finished reports are taken from the cache, also when queried one by one
+    assert client.get_attending_character_list("c") == ["Wurzel-Blackhand"]
+    assert get.call_count == 2
+
+
+def test_rate_limit_headroom(mocker):
+    rate_limiter = warcraftlogs_client.RateLimiter(headroom=10)
+    rate_limiter.update({"limitPerHour": 100, "pointsSpentThisHour": 80, "pointsResetIn": 3600})
+    rate_limiter.acquire(10, background=True)
+    with pytest.raises(ValueError, match="reserved for interactive requests"):
+        rate_limiter.acquire(1, background=True, max_wait=0)
+    # interactive requests use the headroom
+    rate_limiter.acquire(10, background=False)
+
+    # points are available again after the reset
+    rate_limiter.update({"limitPerHour": 100, "pointsSpentThisHour": 95, "pointsResetIn": 0.1})
+    rate_limiter.acquire(10, background=True, max_wait=5)
+
+
+def test_background_requests_synced(mocker, tmp_path):
+    mocker.patch.object(warcraftlogs_client, "MAX_BACKGROUND_WAIT", 0)
+    client = create_client(mocker, tmp_path)
+    rate_limit = {"rateLimitData": {"limitPerHour": 3600, "pointsSpentThisHour": 3590, "pointsResetIn": 1800}}
+    get = mock_response(mocker, client, 200, 200, data=rate_limit)
+    with pytest.raises(ValueError, match="reserved for interactive requests"):
+        client.get_reports("endTime", ["a"], background=True)
+    assert get.call_count == 1  # only the rate limit was queried
+
+    client.get_data("query")  # interactive request is not delayed
+    assert get.call_count == 2
+
+
+def test_raid_stats(mocker, tmp_path):
+    client = create_client(mocker, tmp_path)
+    fights = [
+        {"id": 1, "size": 5, "name": "Trash", "averageItemLevel": 480.0, "difficulty": 3, "startTime": 0, "endTime": 10},
+        {"id": 4, "size": 20, "name": "Fyrakk", "averageItemLevel": 485.5, "difficulty": 4, "startTime": 100, "endTime": 400},
+    ]
+    report = {"reportData": {"report": {"code": "abc", "title": "Amirdrassil", "endTime": 0, "fights": fights}}}
+    mock_response(mocker, client, 200, data=report)
+    raid_stats = client.get_raid_stats("abc")
+    assert (raid_stats.report_id, raid_stats.name) == ("abc", "Amirdrassil")
+    assert [(fight.id, fight.boss_name, fight.difficulty, fight.duration) for fight in raid_stats.fights] == [(4, "Fyrakk", "4", 300)]
+
+
+def test_async_client_bounded_concurrency(mocker, tmp_path):
+    client = create_client(mocker, tmp_path)
+    lock, running, max_running = threading.Lock(), [0], [0]
+
+    def get_raid_stats(report_id, background):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return RaidStats(report_id=report_id, name="", fights=[])
+
+    mocker.patch.object(client, "get_raid_stats", side_effect=get_raid_stats)
+    start = time.monotonic()
+    result = asyncio.run(AsyncWclClient(client, max_concurrency=3).get_raid_stats_list(["a", "b", "c", "d", "e", "f"]))
+    assert [raid_stats.report_id for raid_stats in result] == ["a", "b", "c", "d", "e", "f"]
+    assert max_running[0] == 3
+    assert time.monotonic() - start < 0.5  # two rounds instead of six requests one after another